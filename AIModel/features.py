@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# Realtime stop ids are numeric; timetable first stops are names, hashed into the same range
+SYNTHETIC_STOP_BUCKETS = 10000
+
+
+class FeatureEncoder:
+    """
+    The feature column order and category codes fitted on training data.
+
+    Saved with the models so inference encodes rows exactly as training did, rather than
+    re-deriving codes from whatever categories happen to be in a prediction batch.
+    Unknown categories and missing values encode as -1.
+    """
+
+    def __init__(self, feature_columns=None, category_maps=None):
+        self.feature_columns = list(feature_columns or [])
+        self.category_maps = dict(category_maps or {})
+
+    def fit(self, X: pd.DataFrame):
+        self.feature_columns = X.columns.tolist()
+        self.category_maps = {
+            col: sorted(X[col].dropna().astype(str).unique().tolist())
+            for col in X.columns
+            if X[col].dtype == object
+        }
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        X = X.reindex(columns=self.feature_columns)
+        encoded = {}
+        for col in self.feature_columns:
+            if col in self.category_maps:
+                encoded[col] = pd.Categorical(X[col].astype("string"), categories=self.category_maps[col]).codes
+            else:
+                encoded[col] = pd.to_numeric(X[col], errors="coerce")
+        return pd.DataFrame(encoded, index=X.index).fillna(-1)
+
+    def fit_transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        return self.fit(X).transform(X)
+
+    def to_dict(self) -> dict:
+        return {"feature_columns": self.feature_columns, "category_maps": self.category_maps}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["feature_columns"], data.get("category_maps"))
+
+
+def synthetic_stop_ids(names: pd.Series) -> pd.Series:
+    """Deterministic numeric ids for stop names, hashed in one pass."""
+    hashes = pd.util.hash_array(names.fillna("").astype(str).to_numpy(dtype=object))
+    return pd.Series((hashes % SYNTHETIC_STOP_BUCKETS).astype(np.int64), index=names.index)
+
+
+def first_stop_timestamps(trips: pd.DataFrame) -> pd.Series:
+    """Unix time of each trip's first stop; GTFS times past 24:00:00 roll into the next day."""
+    service_dates = pd.to_datetime(trips["service_date"], format="%Y-%m-%d", errors="coerce")
+    midnight = (service_dates - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    if "first_stop_arrival_seconds" in trips:
+        offsets = pd.to_numeric(trips["first_stop_arrival_seconds"], errors="coerce")
+    else:
+        # Backends older than the integer time columns only send HH:MM:SS
+        offsets = pd.to_timedelta(trips["first_stop_arrival_time"], errors="coerce") // pd.Timedelta(seconds=1)
+    return (midnight + offsets).fillna(-1).astype(np.int64)
+
+
+def build_trip_features(trips: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds raw model features for every trip in a /trips response at once.
+
+    The columns mirror the realtime training data; values the timetable cannot know
+    (the vehicle) are left missing for the encoder to fill.
+    """
+    return pd.DataFrame({
+        "trip_id": trips["trip_id"],
+        "route_id": trips["route_id"],
+        "direction_id": trips["direction_id"],
+        "stop_id": synthetic_stop_ids(trips["first_stop"]),
+        "stop_sequence": 0,
+        "vehicle_id": np.nan,
+        "timestamp": first_stop_timestamps(trips),
+    }, index=trips.index)
@@ -0,0 +1,216 @@
+"""
+Streams GTFS-realtime trip updates into date-partitioned Parquet history for training.
+
+    python ingest.py                                # poll GTFS_RT_URL every GTFS_RT_POLL_SECONDS
+    python ingest.py --file feed.pb                 # poll a local file instead
+    python ingest.py --replay translink_gtfsrt.pb   # ingest saved snapshots once, in order
+
+History is written to GTFS_HISTORY_DIR/service_date=YYYY-MM-DD/part-*.parquet and can be
+passed to `python train.py --data <dir>`.
+"""
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import requests
+from google.transit import gtfs_realtime_pb2
+
+GTFS_RT_URL = os.environ.get("GTFS_RT_URL")
+POLL_SECONDS = float(os.environ.get("GTFS_RT_POLL_SECONDS", 30))
+HISTORY_DIR = os.environ.get("GTFS_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"))
+
+# Buffered rows are written when either limit is reached, so memory stays bounded
+FLUSH_ROWS = int(os.environ.get("GTFS_HISTORY_FLUSH_ROWS", 50000))
+FLUSH_SECONDS = float(os.environ.get("GTFS_HISTORY_FLUSH_SECONDS", 300))
+
+# Dedupe keys are kept for this many of the most recent service dates
+SEEN_PARTITIONS = 2
+
+DEDUPE_KEY = ["trip_id", "stop_sequence", "timestamp"]
+
+
+def parse_feed(content: bytes) -> pd.DataFrame:
+    """Parses a FeedMessage into one row per stop_time_update, with the training CSV's columns."""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    fallback_date = datetime.fromtimestamp(feed.header.timestamp or time.time(), timezone.utc).strftime("%Y%m%d")
+
+    # Trip-level values are repeated once per update; stop-level values are appended directly
+    trip_ids, route_ids, direction_ids, vehicle_ids, service_dates = [], [], [], [], []
+    stop_ids, stop_sequences, arrival_delays, departure_delays, timestamps = [], [], [], [], []
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        tu = entity.trip_update
+        updates = tu.stop_time_update
+        count = len(updates)
+        if not count:
+            continue
+
+        trip = tu.trip
+        trip_ids.extend([trip.trip_id] * count)
+        route_ids.extend([trip.route_id] * count)
+        direction_ids.extend([trip.direction_id] * count)
+        vehicle_ids.extend([tu.vehicle.id if tu.HasField("vehicle") else None] * count)
+        service_dates.extend([trip.start_date or fallback_date] * count)
+
+        for stop in updates:
+            has_arrival = stop.HasField("arrival")
+            stop_ids.append(stop.stop_id)
+            stop_sequences.append(stop.stop_sequence)
+            arrival_delays.append(stop.arrival.delay if has_arrival else np.nan)
+            departure_delays.append(stop.departure.delay if stop.HasField("departure") else np.nan)
+            timestamps.append(stop.arrival.time if has_arrival else np.nan)
+
+    arrival_delay = np.array(arrival_delays, dtype=float)
+    return pd.DataFrame({
+        "trip_id": trip_ids,
+        "route_id": route_ids,
+        "direction_id": np.array(direction_ids, dtype=np.int64),
+        "stop_id": stop_ids,
+        "stop_sequence": np.array(stop_sequences, dtype=np.int64),
+        "vehicle_id": vehicle_ids,
+        "arrival_delay": arrival_delay,
+        "departure_delay": np.array(departure_delays, dtype=float),
+        "timestamp": np.array(timestamps, dtype=float),
+        "delayed": (np.nan_to_num(arrival_delay) > 0).astype(np.int64),
+        "service_date": pd.to_datetime(pd.Series(service_dates, dtype=str), format="%Y%m%d").dt.strftime("%Y-%m-%d"),
+    })
+
+
+class HistoryWriter:
+    """
+    Buffers parsed updates, drops ones already ingested and appends them as Parquet files.
+
+    An update is a duplicate when its (trip_id, stop_sequence, timestamp) was seen before
+    in the same service date, which is how a feed re-publishes an unchanged prediction.
+    """
+
+    def __init__(self, history_dir: str = HISTORY_DIR):
+        self.history_dir = history_dir
+        self._seen = {}
+        self._buffer = []
+        self._buffered_rows = 0
+        self._last_flush = time.monotonic()
+        self.rows_written = 0
+
+    def append(self, df: pd.DataFrame) -> int:
+        """Adds new rows to the buffer and returns how many were not duplicates."""
+        df = df.drop_duplicates(subset=DEDUPE_KEY)
+        keys = pd.util.hash_pandas_object(df[DEDUPE_KEY], index=False).to_numpy()
+        is_new = np.ones(len(df), dtype=bool)
+        for service_date, positions in df.groupby("service_date").indices.items():
+            seen = self._seen_keys(service_date)
+            fresh = ~np.isin(keys[positions], seen)
+            is_new[positions] = fresh
+            self._seen[service_date] = np.concatenate([seen, keys[positions][fresh]])
+        self._forget_old_partitions()
+
+        new_rows = df[is_new]
+        if not new_rows.empty:
+            self._buffer.append(new_rows)
+            self._buffered_rows += len(new_rows)
+        if self._buffered_rows >= FLUSH_ROWS or time.monotonic() - self._last_flush >= FLUSH_SECONDS:
+            self.flush()
+        return len(new_rows)
+
+    def flush(self) -> int:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return 0
+        df = pd.concat(self._buffer, ignore_index=True)
+        self._buffer, self._buffered_rows = [], 0
+
+        for service_date, part in df.groupby("service_date"):
+            directory = os.path.join(self.history_dir, f"service_date={service_date}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet")
+            # Write under a temporary name so readers never load a partial file
+            part.drop(columns=["service_date"]).to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+        self.rows_written += len(df)
+        print(f"Wrote {len(df)} rows ({self.rows_written} total) to {self.history_dir}")
+        return len(df)
+
+    def _seen_keys(self, service_date: str) -> np.ndarray:
+        if service_date not in self._seen:
+            # Resume from what earlier runs already wrote for this date
+            directory = os.path.join(self.history_dir, f"service_date={service_date}")
+            keys = np.empty(0, dtype=np.uint64)
+            if os.path.isdir(directory) and any(name.endswith(".parquet") for name in os.listdir(directory)):
+                existing = pd.read_parquet(directory, columns=DEDUPE_KEY)
+                keys = pd.util.hash_pandas_object(existing, index=False).to_numpy()
+            self._seen[service_date] = keys
+        return self._seen[service_date]
+
+    def _forget_old_partitions(self):
+        for service_date in sorted(self._seen)[:-SEEN_PARTITIONS]:
+            del self._seen[service_date]
+
+
+def read_history(history_dir: str = HISTORY_DIR) -> pd.DataFrame:
+    """Loads ingested history with the same columns and numeric ids as gtfs_realtime.csv."""
+    df = pd.read_parquet(history_dir).drop(columns=["service_date"])
+    for col in ["trip_id", "route_id", "stop_id", "vehicle_id"]:
+        numeric = pd.to_numeric(df[col], errors="coerce")
+        if numeric.notna().sum() == df[col].replace("", np.nan).notna().sum():
+            df[col] = numeric
+    return df
+
+
+def fetch(url: str = None, path: str = None) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    resp = requests.get(url, timeout=20)
+    resp.raise_for_status()
+    return resp.content
+
+
+def ingest(content: bytes, writer: HistoryWriter) -> int:
+    df = parse_feed(content)
+    added = writer.append(df)
+    print(f"Parsed {len(df)} stop time updates, {added} new")
+    return added
+
+
+def replay(paths: list, writer: HistoryWriter):
+    for path in paths:
+        print(f"Replaying {path}")
+        ingest(fetch(path=path), writer)
+    writer.flush()
+
+
+def poll(writer: HistoryWriter, url: str = None, path: str = None, interval: float = POLL_SECONDS):
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                ingest(fetch(url, path), writer)
+            except Exception as e:
+                print(f"Error ingesting feed: {e}")
+            time.sleep(max(interval - (time.monotonic() - started), 0))
+    finally:
+        writer.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append GTFS-realtime trip updates to Parquet history.")
+    parser.add_argument("--url", default=GTFS_RT_URL, help="Feed URL to poll (default: GTFS_RT_URL)")
+    parser.add_argument("--file", help="Local feed file to poll instead of a URL")
+    parser.add_argument("--replay", nargs="+", metavar="PB", help="Ingest these saved feeds once and exit")
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS, help="Seconds between polls")
+    args = parser.parse_args()
+
+    writer = HistoryWriter(args.history_dir)
+    if args.replay:
+        replay(args.replay, writer)
+    elif args.url or args.file:
+        poll(writer, args.url, args.file, args.interval)
+    else:
+        parser.error("set GTFS_RT_URL or pass --url, --file or --replay")
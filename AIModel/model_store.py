@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import joblib
+
+from features import FeatureEncoder
+
+# Versioned artifacts live in MODEL_DIR/<version>/, with MODEL_DIR/LATEST naming the one to serve
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+LATEST_FILE = "LATEST"
+
+
+class ModelArtifact:
+    def __init__(self, version, models, metadata):
+        self.version = version
+        self.models = models
+        self.metadata = metadata
+        self.encoder = FeatureEncoder.from_dict(metadata.get("encoder", metadata))
+
+
+def save_artifact(models: dict, encoder: FeatureEncoder, metrics: dict, extra: dict = None, report: dict = None, model_dir: str = MODEL_DIR) -> str:
+    """Writes models, their feature encoding and an optional training report as a new version, then points LATEST at it."""
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    suffix = 1
+    while os.path.exists(os.path.join(model_dir, version)):
+        version = f"{version.split('-')[0]}-{suffix}"
+        suffix += 1
+
+    # Build in a temporary directory so readers never see a half-written version
+    path = os.path.join(model_dir, version)
+    tmp_path = path + ".tmp"
+    os.makedirs(tmp_path)
+    for name, model in models.items():
+        # Uncompressed so numpy arrays inside the estimators can be memory-mapped on load
+        joblib.dump(model, os.path.join(tmp_path, f"{name}.joblib"))
+
+    metadata = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "models": list(models),
+        "encoder": encoder.to_dict(),
+        "metrics": metrics,
+    }
+    metadata.update(extra or {})
+    with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    if report is not None:
+        with open(os.path.join(tmp_path, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    os.rename(tmp_path, path)
+
+    latest_tmp = os.path.join(model_dir, LATEST_FILE + ".tmp")
+    with open(latest_tmp, "w") as f:
+        f.write(version)
+    os.replace(latest_tmp, os.path.join(model_dir, LATEST_FILE))
+    return version
+
+
+def latest_version(model_dir: str = MODEL_DIR):
+    try:
+        with open(os.path.join(model_dir, LATEST_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def latest_metadata(model_dir: str = MODEL_DIR):
+    """metadata.json of the latest version, or None if nothing has been published."""
+    version = latest_version(model_dir)
+    if version is None:
+        return None
+    with open(os.path.join(model_dir, version, "metadata.json")) as f:
+        return json.load(f)
+
+
+def load_artifact(version: str = None, model_dir: str = MODEL_DIR, mmap: bool = True) -> ModelArtifact:
+    """Loads a version (the latest by default), memory-mapping model arrays instead of copying them."""
+    version = version or latest_version(model_dir)
+    if version is None:
+        raise FileNotFoundError(f"No trained models in {model_dir}. Run `python train.py` first.")
+
+    path = os.path.join(model_dir, version)
+    with open(os.path.join(path, "metadata.json")) as f:
+        metadata = json.load(f)
+    models = {
+        name: joblib.load(os.path.join(path, f"{name}.joblib"), mmap_mode="r" if mmap else None)
+        for name in metadata["models"]
+    }
+    return ModelArtifact(version, models, metadata)
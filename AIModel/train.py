@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split, StratifiedKFold
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from xgboost import XGBClassifier
+
+from features import FeatureEncoder
+from model_store import save_artifact, latest_metadata
+
+# Hyperparameters tried for each model family; the first entry is the previous fixed configuration
+PARAM_GRIDS = {
+    "RandomForest": [
+        {},
+        {"n_estimators": 300, "min_samples_leaf": 2},
+    ],
+    "LogisticRegression": [
+        {"logisticregression__C": 1.0},
+        {"logisticregression__C": 0.1},
+    ],
+    "XGBoost": [
+        {"max_depth": 6},
+        {"max_depth": 4, "n_estimators": 300},
+    ],
+}
+
+
+def build_model(name: str, params: dict = None):
+    # Each worker process fits one model at a time, so estimators stay single-threaded
+    if name == "RandomForest":
+        model = RandomForestClassifier(n_jobs=1)
+    elif name == "LogisticRegression":
+        model = make_pipeline(SimpleImputer(strategy="most_frequent"), LogisticRegression(max_iter=1000))
+    elif name == "XGBoost":
+        model = XGBClassifier(
+            n_estimators=200,
+            max_depth=6,
+            learning_rate=0.1,
+            subsample=0.8,
+            colsample_bytree=0.8,
+            eval_metric="logloss",   # prevents warnings
+            n_jobs=1
+        )
+    else:
+        raise ValueError(f"Unknown model {name}")
+    return model.set_params(**(params or {}))
+
+
+def training_data_mtime(path: str) -> float:
+    """Newest modification time of the training CSV, or of any file in a history directory."""
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    mtimes = [os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names]
+    return max(mtimes, default=os.path.getmtime(path))
+
+
+def data_changed_since_last_training(path: str) -> bool:
+    """False only if the latest artifact was trained on this data and nothing in it changed since."""
+    metadata = latest_metadata()
+    if metadata is None or metadata.get("training_data") != path or "training_data_mtime" not in metadata:
+        return True
+    return training_data_mtime(path) > metadata["training_data_mtime"]
+
+
+def load_training_data(path: str):
+    # A directory is Parquet history written by ingest.py; a file is a CSV snapshot
+    if os.path.isdir(path):
+        from ingest import read_history
+        df = read_history(path)
+    else:
+        df = pd.read_csv(path)
+    # 1. Drop only arrival & departure delays. Keep stop_id, stop_sequence, timestamp for model features
+    df2 = df.drop(columns=["arrival_delay", "departure_delay"])
+
+    # 2. Features (everything except delayed)
+    X = df2.drop(columns=["delayed"])
+    y = df2["delayed"]
+
+    # 3. Encode categorical feature columns with codes that are saved for inference
+    encoder = FeatureEncoder()
+    X = encoder.fit_transform(X)
+    return X, y, encoder
+
+
+# Training data for worker processes, sent once per worker rather than once per task
+_X = None
+_y = None
+
+
+def _init_worker(X, y):
+    global _X, _y
+    _X, _y = X, y
+
+
+def _timed_fit(name, params, train_idx, test_idx):
+    """Fits on one split and returns (model, predictions, accuracy, fit seconds, predict seconds)."""
+    model = build_model(name, params)
+    started = time.perf_counter()
+    model.fit(_X.iloc[train_idx], _y.iloc[train_idx])
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    preds = model.predict(_X.iloc[test_idx])
+    predict_seconds = time.perf_counter() - started
+    return model, preds, accuracy_score(_y.iloc[test_idx], preds), fit_seconds, predict_seconds
+
+
+def cross_validate(name: str, params: dict, folds: int) -> dict:
+    """Scores one candidate with stratified k-fold CV; runs in a worker process."""
+    # tracemalloc sees Python and numpy allocations, not memory held inside native libraries
+    tracemalloc.start()
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    scores, fit_times, predict_times = [], [], []
+    for train_idx, test_idx in splitter.split(_X, _y):
+        _, _, accuracy, fit_seconds, predict_seconds = _timed_fit(name, params, train_idx, test_idx)
+        scores.append(accuracy)
+        fit_times.append(fit_seconds)
+        predict_times.append(predict_seconds)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "model": name,
+        "params": params,
+        "cv_accuracy_mean": float(np.mean(scores)),
+        "cv_accuracy_std": float(np.std(scores)),
+        "fit_seconds_mean": float(np.mean(fit_times)),
+        "predict_seconds_mean": float(np.mean(predict_times)),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+
+
+def fit_final(name: str, params: dict, train_idx, test_idx):
+    """Refits a chosen candidate on the training split and scores it on the hold-out set."""
+    tracemalloc.start()
+    model, preds, accuracy, fit_seconds, predict_seconds = _timed_fit(name, params, train_idx, test_idx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return model, {
+        "params": params,
+        "accuracy": accuracy,
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+        "peak_memory_mb": peak / 2 ** 20,
+        "classification_report": classification_report(_y.iloc[test_idx], preds, output_dict=True, zero_division=0),
+    }
+
+
+def train(data_path: str, folds: int = 5, workers: int = None, report_path: str = None) -> str:
+    """
+    Cross-validates every grid candidate in parallel, refits the best configuration of each
+    model family and publishes them as a new artifact version with a timing report.
+    """
+    started = time.perf_counter()
+    # Taken before reading, so data written during training triggers the next run
+    data_mtime = training_data_mtime(data_path)
+    X, y, encoder = load_training_data(data_path)
+    workers = workers or os.cpu_count() or 1
+
+    # 4. Train/test split; cross-validation only sees the training part
+    train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+
+    # 5. Score every candidate across the process pool
+    candidates = [(name, params) for name, grid in PARAM_GRIDS.items() for params in grid]
+    print(f"Cross-validating {len(candidates)} candidates ({folds} folds) on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X.iloc[train_idx], y.iloc[train_idx])) as pool:
+        futures = [pool.submit(cross_validate, name, params, folds) for name, params in candidates]
+        cv_results = [future.result() for future in futures]
+
+    best = {}
+    for result in cv_results:
+        print(f"{result['model']} {result['params']}: {result['cv_accuracy_mean']:.4f} "
+              f"(+/- {result['cv_accuracy_std']:.4f}), fit {result['fit_seconds_mean']:.2f}s, "
+              f"peak {result['peak_memory_mb']:.1f} MiB")
+        if result["model"] not in best or result["cv_accuracy_mean"] > best[result["model"]]["cv_accuracy_mean"]:
+            best[result["model"]] = result
+
+    # 6. Refit each family's best configuration and score it on the hold-out set
+    with ProcessPoolExecutor(max_workers=min(workers, len(best)), initializer=_init_worker, initargs=(X, y)) as pool:
+        futures = {
+            name: pool.submit(fit_final, name, result["params"], train_idx, test_idx)
+            for name, result in best.items()
+        }
+        fitted = {name: future.result() for name, future in futures.items()}
+
+    models = {name: model for name, (model, _) in fitted.items()}
+    final = {name: holdout for name, (_, holdout) in fitted.items()}
+    for name, holdout in final.items():
+        print(f"\n=== {name} ===")
+        print("Params:", holdout["params"])
+        print("Hold-out accuracy:", holdout["accuracy"])
+
+    # Every family keeps its prediction bot; the best hold-out model is marked as selected
+    selected = max(final, key=lambda name: final[name]["accuracy"])
+    report = {
+        "training_data": data_path,
+        "training_rows": len(X),
+        "folds": folds,
+        "workers": workers,
+        "selected_model": selected,
+        "candidates": cv_results,
+        "final": final,
+        "total_seconds": time.perf_counter() - started,
+    }
+
+    version = save_artifact(
+        models,
+        encoder,
+        {name: {"accuracy": holdout["accuracy"], "params": holdout["params"]} for name, holdout in final.items()},
+        extra={"training_data": data_path, "training_data_mtime": data_mtime, "training_rows": len(X), "selected_model": selected},
+        report=report,
+    )
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"\nPublished model version {version}; selected {selected} ({report['total_seconds']:.1f}s)")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the delay models and publish a versioned artifact.")
+    parser.add_argument("--data", default="gtfs_realtime.csv", help="Training CSV, or a history directory written by ingest.py")
+    parser.add_argument("--if-data-changed", action="store_true",
+                        help="Skip training unless the training data changed since the latest artifact was built")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds")
+    parser.add_argument("--workers", type=int, default=None, help="Training processes (default: all cores)")
+    parser.add_argument("--report", default=None, help="Also write the training report JSON here")
+    args = parser.parse_args()
+
+    if args.if_data_changed and not data_changed_since_last_training(args.data):
+        print(f"{args.data} has not changed since the latest models were trained; skipping training.")
+    else:
+        train(args.data, args.folds, args.workers, args.report)
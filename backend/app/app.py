@@ -1,5 +1,5 @@
 import os
-from flask import Flask, jsonify, g, current_app, redirect, url_for
+from flask import Flask, jsonify, current_app, redirect, url_for
 from flask_jwt_extended import JWTManager
 from flask_swagger_ui import get_swaggerui_blueprint
 import json
@@ -7,12 +7,16 @@ import psycopg2
 from flask_cors import CORS
 from flask_apscheduler import APScheduler
 
-from .auth.routes import auth_bp, get_db_connection
-from .trips import trips_bp, load_data_from_db, trips_df, stop_times_df # Import global dataframes
+from .auth.routes import auth_bp
+from .db import init_db, pool_stats
+from .metrics import init_metrics, metrics_response
+from . import trips as timetable
+from .trips import trips_bp, load_data_from_db, start_timetable
 from .predictions import predictions_bp
-from .resolver import resolve_pending_trips
+from .resolver import start_resolver
 from .contact import contact_bp
-from .email_service import init_email_service
+from .leaderboard import leaderboard_bp, refresh_rank_table, REFRESH_SECONDS as LEADERBOARD_REFRESH_SECONDS
+from .email_service import init_email_service, drain_outbox
 
 # URL for exposing Swagger UI (without trailing '/')
 SWAGGER_URL = '/api/docs'
@@ -46,7 +50,7 @@ def create_app():
         resources={r"/*": {"origins": origins}},
         supports_credentials=True,
         allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-        expose_headers=["Content-Type", "Authorization"],
+        expose_headers=["Content-Type", "Authorization", "ETag", "X-Data-Version", "X-Next-Cursor", "Link"],
         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     )
 
@@ -59,28 +63,35 @@ def create_app():
     # Initialize email service
     init_email_service(app)
 
-    @app.teardown_appcontext
-    def close_db(e=None):
-        db = g.pop('db', None)
-        if db is not None:
-            db.close()
+    # Pooled database connections, returned to the pool at the end of each app context
+    init_db(app)
+
+    # Per-endpoint latency, status codes and SQL usage, exposed at /metrics
+    init_metrics(app)
 
     @app.route('/')
     def hello():
         return redirect("/api/docs")
 
-    @app.route('/leaderboard', methods=['GET'])
-    def get_leaderboard():
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute('SELECT nickname, cumulative_score FROM users ORDER BY cumulative_score DESC LIMIT 10;')
-                leaderboard = cur.fetchall()
-                # The result from fetchall is a list of tuples. Convert to a list of dicts for proper JSON.
-                leaderboard_json = [{"nickname": row[0], "cumulative_score": row[1]} for row in leaderboard]
-                return jsonify(leaderboard_json)
-        finally:
-            conn.close()
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({"status": "ok", "db_pool": pool_stats()})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        # Metrics are per process; scrape each worker, or aggregate them in Prometheus
+        db_pool = pool_stats()
+        loaded = timetable.get_timetable()
+        return metrics_response({
+            "db_pool_connections_open": ("Open pooled database connections.", db_pool.get("open", 0)),
+            "db_pool_connections_in_use": ("Pooled connections checked out.", db_pool.get("in_use", 0)),
+            "timetable_trips": ("Trips in the in-memory timetable.", len(loaded.trip_index) if loaded else 0),
+            "timetable_data_version": ("Version of the loaded timetable snapshot.", loaded.version if loaded else 0),
+            "resolution_queue_size": ("Trips waiting for their resolution deadline.", len(timetable.resolution_queue)),
+        }, {
+            "db_pool_waits_total": ("Checkouts that had to wait for a free connection.", db_pool.get("waits", 0)),
+            "db_pool_timeouts_total": ("Checkouts that gave up waiting.", db_pool.get("timeouts", 0)),
+        })
 
     @app.get('/swagger.json')
     def swagger_spec():
@@ -95,18 +106,31 @@ def create_app():
     app.register_blueprint(trips_bp)
     app.register_blueprint(predictions_bp)
     app.register_blueprint(contact_bp)
+    app.register_blueprint(leaderboard_bp)
 
-    # Load dataframes once at startup
+    # Serve the cached timetable snapshot (if any) at once and validate or rebuild it in the
+    # background; it is refreshed in place by the scheduler
+    start_timetable()
     with app.app_context():
-        load_data_from_db()
+        refresh_rank_table()
 
     # Initialize and start the scheduler
     scheduler = APScheduler()
     scheduler.init_app(app)
     scheduler.start()
 
-    # Add a job to resolve pending trips every minute, passing the app and dataframes
-    scheduler.add_job(id='resolve_trips', func=resolve_pending_trips, trigger='interval', minutes=1, args=[app, trips_df, stop_times_df])
+    # Deliver queued emails in the background so requests never wait on SMTP
+    scheduler.add_job(id='drain_email_outbox', func=drain_outbox, trigger='interval', seconds=app.config['EMAIL_OUTBOX_POLL_SECONDS'], args=[app])
+
+    # Pick up score changes credited by other processes without reloading on the request path
+    scheduler.add_job(id='refresh_leaderboard', func=refresh_rank_table, trigger='interval', seconds=LEADERBOARD_REFRESH_SECONDS)
+
+    # Roll the timetable window forward shortly after midnight so the next service day is served without a restart
+    refresh_hour, refresh_minute = (int(part) for part in os.environ.get('TIMETABLE_REFRESH_TIME', '00:01').split(':'))
+    scheduler.add_job(id='refresh_timetable', func=load_data_from_db, trigger='cron', hour=refresh_hour, minute=refresh_minute)
+
+    # One process across all workers resolves trips (and polls the realtime feed) as deadlines come due
+    start_resolver(app)
 
     return app
 
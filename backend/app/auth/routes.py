@@ -1,12 +1,14 @@
 import os
 from flask import Blueprint
-from flask import jsonify, g, request
+from flask import jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token, create_refresh_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import psycopg2
 from flask_cors import CORS, cross_origin
-from ..email_service import send_welcome_email
+from ..email_service import queue_welcome_email
+from ..db import get_db_connection
+from ..leaderboard import record_new_user, score_changes_lock
 
 
 
@@ -37,16 +39,6 @@ def upload_image(photo):
         return os.path.join(UPLOAD_FOLDER, filename)
 
 
-def get_db_connection():
-    if 'db' not in g:
-        g.db = psycopg2.connect(
-            host=os.environ.get('POSTGRES_HOST'),
-            database=os.environ.get('POSTGRES_DB'),
-            user=os.environ.get('POSTGRES_USER'),
-            password=os.environ.get('POSTGRES_PASSWORD')
-        )
-    return g.db
-
 import psycopg2.extras
 
 @auth_bp.route('/users', methods=['GET', 'OPTIONS'])
@@ -86,16 +78,13 @@ def add_user():
                 (email, hashed_password, nickname, cumulative_score)
             )
             user_id = cur.fetchone()[0]
-            conn.commit()
+            # Queued in the same transaction; the outbox worker sends it outside the request
+            queue_welcome_email(cur, email, nickname)
+            with score_changes_lock:
+                conn.commit()
+                record_new_user(user_id, nickname)
             cur.close()
             
-            # Send welcome email (non-blocking)
-            try:
-                send_welcome_email(email, nickname)
-            except Exception as e:
-                # Log error but don't fail registration
-                print(f"Failed to send welcome email: {e}")
-            
             return jsonify({'id': user_id, 'message': 'User created successfully'}), 201
         except psycopg2.IntegrityError:
             conn.rollback()
@@ -159,6 +148,11 @@ def send_friend_request():
             conn.commit()
             cur.close()
             return jsonify({"msg": "Friend request sent"}), 201
+        except psycopg2.errors.UniqueViolation:
+            # A concurrent request for the same pair won the unique index
+            conn.rollback()
+            cur.close()
+            return jsonify({"error": "Friend request already sent or received"}), 409
         except psycopg2.Error as e:
             conn.rollback()
             cur.close()
@@ -258,6 +252,5 @@ def get_friends():
         friends = [{"id": row[0], "nickname": row[1], "email": row[2], "cumulative_score": row[3]} for row in cur.fetchall()]
         
         cur.close()
-        conn.close() # It's also a good practice to close the connection
         
         return jsonify(friends)
\ No newline at end of file
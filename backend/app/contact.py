@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
-from .email_service import send_contact_email
+from .email_service import queue_contact_email
+from .db import get_db_connection
 import re
 
 contact_bp = Blueprint('contact', __name__, url_prefix='/contact')
@@ -48,19 +49,23 @@ def send_contact_message():
         if errors:
             return jsonify({'error': 'Validation failed', 'details': errors}), 400
         
-        # Send email
-        success, result_message = send_contact_email(name, email, message)
-        
-        if success:
-            return jsonify({
-                'message': 'Contact message sent successfully',
-                'status': 'success'
-            }), 200
-        else:
+        # Queue email; the outbox worker delivers it
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                queue_contact_email(cur, name, email, message)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
             return jsonify({
                 'error': 'Failed to send message',
-                'details': result_message
+                'details': str(e)
             }), 500
+
+        return jsonify({
+            'message': 'Contact message sent successfully',
+            'status': 'success'
+        }), 200
             
     except Exception as e:
         return jsonify({
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from flask import g
+
+from .metrics import InstrumentedConnection
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the configured wait timeout."""
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe psycopg2 connection pool.
+
+    Unlike psycopg2's ThreadedConnectionPool, callers wait up to `timeout` seconds for a
+    free connection instead of failing immediately, every returned connection stays open
+    for reuse (ThreadedConnectionPool closes those beyond minconn), and connections that
+    have been idle longer than `health_check_interval` seconds are pinged before being
+    handed out. minconn connections are opened up front, the rest as load requires.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, health_check_interval, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # Idle connections, most recently returned last; every open connection is either here or checked out
+        self._idle = []
+        self._open = 0
+        self._idle_since = {}
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "in_use": 0,
+            "total_wait_seconds": 0.0,
+        }
+        for _ in range(minconn):
+            conn = self._connect()
+            with self._lock:
+                self._idle_since[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump("timeouts")
+                raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["total_wait_seconds"] += time.monotonic() - start
+        return conn
+
+    def putconn(self, conn, close=False):
+        # Never hand a connection with an open or failed transaction to the next caller
+        if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        close = close or bool(conn.closed)
+
+        with self._lock:
+            self._stats["in_use"] -= 1
+        if close:
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._idle_since[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+        self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            idle, open_connections = len(self._idle), self._open
+        stats.update({
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "idle": idle,
+            "open": open_connections,
+            "wait_timeout_seconds": self.timeout,
+        })
+        return stats
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._lock:
+            self._open += 1
+        return conn
+
+    def _checkout_healthy(self):
+        # Reuses the most recently returned connection, discarding dead ones until a live one turns
+        # up; after a server restart that can be all of them. With none idle a fresh connection is
+        # opened, which raises if the server is down. The caller holds a slot, so at most maxconn
+        # connections are ever open.
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        with self._lock:
+            idle_since = self._idle_since.get(id(conn))
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._bump("discarded")
+        self._close(conn)
+
+    def _close(self, conn):
+        with self._lock:
+            self._idle_since.pop(id(conn), None)
+            self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def pool_config_from_env() -> dict:
+    return {
+        "minconn": int(os.environ.get('POSTGRES_POOL_MIN', 1)),
+        "maxconn": int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+        "timeout": float(os.environ.get('POSTGRES_POOL_TIMEOUT_SECONDS', 10)),
+        "health_check_interval": float(os.environ.get('POSTGRES_POOL_HEALTH_CHECK_SECONDS', 30)),
+    }
+
+
+def connection_params() -> dict:
+    return {
+        "host": os.environ.get('POSTGRES_HOST'),
+        "database": os.environ.get('POSTGRES_DB'),
+        "user": os.environ.get('POSTGRES_USER'),
+        "password": os.environ.get('POSTGRES_PASSWORD'),
+    }
+
+
+def get_pool() -> ConnectionPool:
+    """Returns this process's pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    **connection_params(),
+                    # Every statement is counted and timed for /metrics
+                    connection_factory=InstrumentedConnection,
+                    **pool_config_from_env()
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def pool_stats() -> dict:
+    if _pool is None or _pool_pid != os.getpid():
+        return {"open": 0, "in_use": 0}
+    return _pool.stats()
+
+
+def get_db_connection():
+    """Returns the pooled connection bound to the current app context, checking one out on first use."""
+    if 'db' not in g:
+        g.db = get_pool().getconn()
+    return g.db
+
+
+def release_db_connection(e=None):
+    """Returns the app context's connection to the pool. Registered as a teardown handler."""
+    db = g.pop('db', None)
+    if db is not None:
+        get_pool().putconn(db)
+
+
+@contextmanager
+def pooled_connection():
+    """Checks out a pooled connection for code that runs outside a request."""
+    conn = get_pool().getconn()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
+
+
+def init_db(app):
+    """Wires pooled connections into the Flask app lifecycle"""
+    app.teardown_appcontext(release_db_connection)
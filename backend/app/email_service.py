@@ -1,11 +1,20 @@
 import os
+import psycopg2.extras
 from flask import current_app
 from flask_mail import Mail, Message
 from datetime import datetime
 
+from .db import pooled_connection
+
 # Initialize mail instance
 mail = Mail()
 
+# Resolved predictions are collected into windows of this length, and each user gets at most one
+# result digest per window, however many resolver runs score their predictions in it
+PREDICTION_DIGEST_WINDOW_SECONDS = int(os.getenv('PREDICTION_DIGEST_WINDOW_MINUTES', 60)) * 60
+# Transaction-level advisory lock taken by the process turning closed windows into digests
+DIGEST_LOCK_KEY = 0x64696773
+
 def init_email_service(app):
     """Initialize email service with Flask app"""
     # Email configuration
@@ -16,21 +25,99 @@ def init_email_service(app):
     app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', app.config['MAIL_USERNAME'])
+
+    # Outbox worker configuration
+    app.config['EMAIL_OUTBOX_POLL_SECONDS'] = int(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', 10))
+    app.config['EMAIL_OUTBOX_BATCH_SIZE'] = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 50))
+    app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+    app.config['EMAIL_OUTBOX_RETRY_SECONDS'] = int(os.getenv('EMAIL_OUTBOX_RETRY_SECONDS', 30))
     
     mail.init_app(app)
 
-def send_contact_email(name, email, message):
-    """Send contact form email"""
-    try:
-        # Create message
-        msg = Message(
-            subject=f'Contact Form Submission from {name}',
-            recipients=[os.getenv('CONTACT_EMAIL', 'support@stormhack.com')],
-            reply_to=email
-        )
-        
-        # Email body
-        msg.body = f"""
+def queue_email(cur, recipient, subject, body, html=None, reply_to=None):
+    """Add a message to the outbox in the caller's transaction; drain_outbox sends it later"""
+    cur.execute(
+        'INSERT INTO email_outbox (recipient, subject, body, html, reply_to) VALUES (%s, %s, %s, %s, %s)',
+        (recipient, subject, body, html, reply_to)
+    )
+
+def drain_outbox(app):
+    """Send due outbox messages over one SMTP connection and schedule retries for failures"""
+    with app.app_context():
+        batch_size = app.config['EMAIL_OUTBOX_BATCH_SIZE']
+        max_attempts = app.config['EMAIL_OUTBOX_MAX_ATTEMPTS']
+        retry_seconds = app.config['EMAIL_OUTBOX_RETRY_SECONDS']
+
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    # Digests for windows that have closed are queued first and go out in this same run
+                    digests = queue_due_digests(cur)
+                    conn.commit()
+                    if digests:
+                        print(f"Email outbox: queued {digests} prediction result digests.")
+
+                    # SKIP LOCKED lets several workers drain the outbox without sending twice
+                    cur.execute('''
+                        SELECT id, recipient, subject, body, html, reply_to
+                        FROM email_outbox
+                        WHERE sent_at IS NULL AND next_attempt_at <= NOW()
+                        ORDER BY next_attempt_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ''', (batch_size,))
+                    rows = cur.fetchall()
+                    if not rows:
+                        conn.commit()
+                        return 0
+
+                    sent, failed = [], []
+                    try:
+                        with mail.connect() as smtp:
+                            for message_id, recipient, subject, body, html, reply_to in rows:
+                                try:
+                                    smtp.send(Message(subject=subject, recipients=[recipient], body=body, html=html, reply_to=reply_to))
+                                    sent.append(message_id)
+                                except Exception as e:
+                                    failed.append((message_id, str(e)))
+                    except Exception as e:
+                        # Could not connect, or the connection dropped: retry everything not yet handled
+                        handled = set(sent) | {message_id for message_id, _ in failed}
+                        failed.extend((row[0], str(e)) for row in rows if row[0] not in handled)
+
+                    if sent:
+                        cur.execute(
+                            'UPDATE email_outbox SET sent_at = NOW(), attempts = attempts + 1, last_error = NULL WHERE id = ANY(%s)',
+                            (sent,)
+                        )
+                    if failed:
+                        # Exponential backoff; messages that run out of attempts are no longer retried
+                        psycopg2.extras.execute_values(cur, '''
+                            UPDATE email_outbox o
+                            SET attempts = o.attempts + 1,
+                                last_error = f.error,
+                                next_attempt_at = CASE
+                                    WHEN o.attempts + 1 >= {max_attempts} THEN NULL
+                                    ELSE NOW() + ({retry_seconds} * POWER(2, o.attempts)) * INTERVAL '1 second'
+                                END
+                            FROM (VALUES %s) AS f (id, error)
+                            WHERE o.id = f.id
+                        '''.format(max_attempts=int(max_attempts), retry_seconds=int(retry_seconds)), failed, template='(%s, %s)')
+                conn.commit()
+
+            if failed:
+                current_app.logger.error(f"Failed to send {len(failed)} outbox emails: {failed[0][1]}")
+            print(f"Email outbox: sent {len(sent)}, failed {len(failed)}.")
+            return len(sent)
+
+        except Exception as e:
+            current_app.logger.error(f"Error draining email outbox: {str(e)}")
+            return 0
+
+def queue_contact_email(cur, name, email, message):
+    """Queue contact form email to the support team"""
+    # Email body
+    body = f"""
 Contact Form Submission
 
 Name: {name}
@@ -43,9 +130,9 @@ Message:
 ---
 This message was sent from the BussinIt contact form.
         """
-        
-        # HTML version
-        msg.html = f"""
+
+    # HTML version
+    html = f"""
         <html>
         <body>
             <h2>Contact Form Submission</h2>
@@ -60,24 +147,19 @@ This message was sent from the BussinIt contact form.
         </body>
         </html>
         """
-        
-        # Send email
-        mail.send(msg)
-        return True, "Email sent successfully"
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to send email: {str(e)}")
-        return False, f"Failed to send email: {str(e)}"
-
-def send_welcome_email(user_email, user_name):
-    """Send welcome email to new users"""
-    try:
-        msg = Message(
-            subject='Welcome to BussinIt!',
-            recipients=[user_email]
-        )
-        
-        msg.body = f"""
+
+    queue_email(
+        cur,
+        recipient=os.getenv('CONTACT_EMAIL', 'support@stormhack.com'),
+        subject=f'Contact Form Submission from {name}',
+        body=body,
+        html=html,
+        reply_to=email
+    )
+
+def queue_welcome_email(cur, user_email, user_name):
+    """Queue welcome email to new users"""
+    body = f"""
 Welcome to BussinIt, {user_name}!
 
 Thank you for joining our bus prediction game. You can now:
@@ -91,8 +173,8 @@ Get started by making your first prediction!
 Best regards,
 The BussinIt Team
         """
-        
-        msg.html = f"""
+    
+    html = f"""
         <html>
         <body>
             <h2>Welcome to BussinIt, {user_name}!</h2>
@@ -109,47 +191,128 @@ The BussinIt Team
         </body>
         </html>
         """
-        
-        mail.send(msg)
-        return True, "Welcome email sent successfully"
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to send welcome email: {str(e)}")
-        return False, f"Failed to send welcome email: {str(e)}"
-
-def send_prediction_notification(user_email, prediction_result):
-    """Send notification when prediction is resolved"""
-    try:
-        msg = Message(
-            subject='Your Bus Prediction Result',
-            recipients=[user_email]
+
+    queue_email(cur, recipient=user_email, subject='Welcome to BussinIt!', body=body, html=html)
+
+def queue_emails(cur, messages):
+    """Add many (recipient, subject, body, html) messages to the outbox with one statement"""
+    if messages:
+        psycopg2.extras.execute_values(
+            cur,
+            'INSERT INTO email_outbox (recipient, subject, body, html) VALUES %s',
+            messages
         )
-        
-        status = "correct" if prediction_result['correct'] else "incorrect"
-        points = prediction_result.get('points_earned', 0)
-        
-        msg.body = f"""
+
+def queue_prediction_results(cur, resolved_predictions):
+    """
+    Add resolved predictions to prediction_digest_queue in the caller's transaction, tagged with
+    the current digest window. drain_outbox mails each user one digest per window once it closes.
+    resolved_predictions are dicts with at least prediction_id and user_id.
+    """
+    if not resolved_predictions:
+        return 0
+    psycopg2.extras.execute_values(
+        cur,
+        'INSERT INTO prediction_digest_queue (prediction_id, user_id, digest_window) VALUES %s ON CONFLICT (prediction_id) DO NOTHING',
+        [(row['prediction_id'], row['user_id']) for row in resolved_predictions],
+        template='(%s, %s, FLOOR(EXTRACT(EPOCH FROM NOW()) / {window})::bigint)'.format(window=int(PREDICTION_DIGEST_WINDOW_SECONDS))
+    )
+    return len(resolved_predictions)
+
+def queue_due_digests(cur):
+    """
+    Turn the queued results of closed digest windows into one email per (user_id, window),
+    in the caller's transaction. Returns the number of digests queued.
+    """
+    # Only one process aggregates at a time, so a user's window is never split across two emails
+    cur.execute('SELECT pg_try_advisory_xact_lock(%s)', (DIGEST_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        return 0
+
+    cur.execute('''
+        DELETE FROM prediction_digest_queue q
+        USING predictions p
+        JOIN users u ON u.id = p.user_id
+        JOIN trips t ON t.trip_id = p.trip_id AND t.service_date = p.service_date
+        LEFT JOIN routes rt ON rt.route_id = t.route_id
+        WHERE q.prediction_id = p.id
+          AND q.digest_window < FLOOR(EXTRACT(EPOCH FROM NOW()) / %s)::bigint
+        RETURNING q.user_id, q.digest_window, q.prediction_id, u.email, u.nickname, u.cumulative_score,
+                  p.trip_id, p.service_date, p.predicted_outcome, t.outcome, t.trip_headsign, rt.route_short_name
+    ''', (int(PREDICTION_DIGEST_WINDOW_SECONDS),))
+
+    by_window = {}
+    for row in sorted(cur.fetchall(), key=lambda row: row[2]):
+        by_window.setdefault((row[0], row[1]), []).append(row)
+
+    messages = []
+    for rows in by_window.values():
+        email, nickname, cumulative_score = rows[0][3:6]
+        results = [
+            {
+                'route_name': route_short_name or 'Unknown Route',
+                'trip_headsign': trip_headsign or trip_id,
+                'service_date': service_date,
+                'predicted_outcome': predicted_outcome,
+                'actual_outcome': outcome,
+                'correct': predicted_outcome == outcome,
+            }
+            for _, _, _, _, _, _, trip_id, service_date, predicted_outcome, outcome, trip_headsign, route_short_name in rows
+        ]
+        messages.append(prediction_digest_email(email, nickname, results, cumulative_score))
+
+    queue_emails(cur, messages)
+    return len(messages)
+
+def prediction_digest_email(user_email, user_name, results, new_total_score):
+    """Build the (recipient, subject, body, html) summary of a user's resolved predictions"""
+    points = sum(1 for result in results if result['correct'])
+    count = len(results)
+    subject = 'Your Bus Prediction Result' if count == 1 else f'Your {count} Bus Prediction Results'
+
+    lines = '\n'.join(
+        f"- {r['route_name']} {r['trip_headsign']} ({r['service_date']}): "
+        f"predicted {r['predicted_outcome']}, was {r['actual_outcome']} - {'correct' if r['correct'] else 'incorrect'}"
+        for r in results
+    )
+    body = f"""
 Prediction Result Update
 
-Your prediction for {prediction_result.get('route_name', 'Unknown Route')} was {status}!
+Hi {user_name}, {count} of your predictions {'was' if count == 1 else 'were'} resolved:
+
+{lines}
 
 Points earned: {points}
-New total score: {prediction_result.get('new_total_score', 0)}
+New total score: {new_total_score}
 
 Keep predicting to climb the leaderboard!
 
 Best regards,
 The BussinIt Team
         """
-        
-        msg.html = f"""
+
+    rows_html = ''.join(
+        f"""
+                <tr style="background-color: {'#d4edda' if r['correct'] else '#f8d7da'};">
+                    <td>{r['route_name']} {r['trip_headsign']}</td>
+                    <td>{r['service_date']}</td>
+                    <td>{r['predicted_outcome']}</td>
+                    <td>{r['actual_outcome']}</td>
+                    <td><strong>{'correct' if r['correct'] else 'incorrect'}</strong></td>
+                </tr>"""
+        for r in results
+    )
+    html = f"""
         <html>
         <body>
             <h2>Prediction Result Update</h2>
-            <p>Your prediction for <strong>{prediction_result.get('route_name', 'Unknown Route')}</strong> was <strong>{status}</strong>!</p>
-            <div style="background-color: {'#d4edda' if prediction_result['correct'] else '#f8d7da'}; padding: 15px; border-radius: 5px; margin: 10px 0;">
+            <p>Hi {user_name}, {count} of your predictions {'was' if count == 1 else 'were'} resolved:</p>
+            <table cellpadding="6" style="border-collapse: collapse;">
+                <tr><th>Trip</th><th>Date</th><th>Predicted</th><th>Actual</th><th>Result</th></tr>{rows_html}
+            </table>
+            <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 10px 0;">
                 <p><strong>Points earned:</strong> {points}</p>
-                <p><strong>New total score:</strong> {prediction_result.get('new_total_score', 0)}</p>
+                <p><strong>New total score:</strong> {new_total_score}</p>
             </div>
             <p>Keep predicting to climb the leaderboard!</p>
             <br>
@@ -157,10 +320,5 @@ The BussinIt Team
         </body>
         </html>
         """
-        
-        mail.send(msg)
-        return True, "Notification sent successfully"
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to send prediction notification: {str(e)}")
-        return False, f"Failed to send prediction notification: {str(e)}"
+
+    return (user_email, subject, body, html)
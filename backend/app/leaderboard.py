@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from .db import get_db_connection, pooled_connection
+
+leaderboard_bp = Blueprint('leaderboard', __name__, url_prefix='/leaderboard')
+
+# Other processes credit scores too, so a scheduler job reloads the table from the database at this interval
+REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 60))
+MAX_LIMIT = 100
+
+# Held from committing score changes (or a new user) until they are applied to the table, and by a
+# reload from its SELECT until the new table is in place. A reload therefore sees a commit together
+# with its in-memory change or neither, so no change is lost or applied twice.
+score_changes_lock = threading.Lock()
+
+
+class RankTable:
+    """
+    An in-memory order-statistics view of users by cumulative score.
+
+    Users are kept in a list sorted by (-score, user_id), so top-N and "around me" windows
+    are slices and a rank is a binary search. Ties share a rank (1, 2, 2, 4, ...).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._order = []
+        self._scores = {}
+        self._nicknames = {}
+        self.loaded_at = None
+
+    def load(self, rows):
+        """Rebuilds the table from (user_id, nickname, cumulative_score) rows."""
+        scores = {user_id: score or 0 for user_id, _, score in rows}
+        nicknames = {user_id: nickname for user_id, nickname, _ in rows}
+        order = sorted((-score, user_id) for user_id, score in scores.items())
+        with self._lock:
+            self._scores, self._nicknames, self._order = scores, nicknames, order
+            self.loaded_at = time.monotonic()
+
+    def add_user(self, user_id, nickname, score=0):
+        with self._lock:
+            if user_id in self._scores:
+                return
+            self._scores[user_id] = score
+            self._nicknames[user_id] = nickname
+            insort(self._order, (-score, user_id))
+
+    def apply_deltas(self, deltas: dict):
+        """Moves each user by their score change, e.g. after a resolver run."""
+        with self._lock:
+            for user_id, points in deltas.items():
+                if user_id not in self._scores:
+                    # Unknown until the next reload; it will be picked up then
+                    continue
+                old_score = self._scores[user_id]
+                del self._order[bisect_left(self._order, (-old_score, user_id))]
+                new_score = old_score + points
+                self._scores[user_id] = new_score
+                insort(self._order, (-new_score, user_id))
+
+    def __len__(self):
+        return len(self._order)
+
+    def top(self, limit: int) -> list:
+        with self._lock:
+            return [self._entry(position) for position in range(min(limit, len(self._order)))]
+
+    def rank(self, user_id):
+        with self._lock:
+            if user_id not in self._scores:
+                return None
+            return self._entry(bisect_left(self._order, (-self._scores[user_id], user_id)))
+
+    def around(self, user_id, radius: int) -> list:
+        with self._lock:
+            if user_id not in self._scores:
+                return None
+            position = bisect_left(self._order, (-self._scores[user_id], user_id))
+            start = max(position - radius, 0)
+            end = min(position + radius + 1, len(self._order))
+            return [self._entry(p) for p in range(start, end)]
+
+    def _entry(self, position: int) -> dict:
+        neg_score, user_id = self._order[position]
+        # Competition ranking: one more than the number of users with a strictly higher score
+        rank = bisect_left(self._order, (neg_score, float('-inf'))) + 1
+        return {
+            "id": user_id,
+            "nickname": self._nicknames.get(user_id),
+            "cumulative_score": -neg_score,
+            "rank": rank,
+        }
+
+
+rank_table = RankTable()
+
+
+def load_rank_table(conn):
+    with score_changes_lock:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id, nickname, cumulative_score FROM users')
+            rows = cur.fetchall()
+        conn.commit()
+        rank_table.load(rows)
+
+
+def get_rank_table() -> RankTable:
+    """Returns the rank table. Reloads run in the background; a request only loads it if startup could not."""
+    if rank_table.loaded_at is None:
+        load_rank_table(get_db_connection())
+    return rank_table
+
+
+def record_score_changes(deltas: dict):
+    """
+    Applies committed score changes so this process's ranks stay exact between reloads.
+    Call while holding score_changes_lock, right after the commit.
+    """
+    if deltas and rank_table.loaded_at is not None:
+        rank_table.apply_deltas(deltas)
+
+
+def record_new_user(user_id, nickname):
+    if rank_table.loaded_at is not None:
+        rank_table.add_user(user_id, nickname)
+
+
+def refresh_rank_table():
+    """Reloads the rank table from the database; run at startup and then every REFRESH_SECONDS by the scheduler."""
+    try:
+        with pooled_connection() as conn:
+            load_rank_table(conn)
+        print(f"Loaded {len(rank_table)} users into the leaderboard.")
+    except Exception as e:
+        print(f"Error loading leaderboard: {e}")
+
+
+def _int_arg(name, default, maximum):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, 0), maximum)
+
+
+@leaderboard_bp.route('', methods=['GET'])
+def get_leaderboard():
+    """Returns the top users by cumulative score (10 by default, ?limit= up to 100)."""
+    limit = _int_arg('limit', 10, MAX_LIMIT)
+    leaderboard_json = [
+        {"nickname": entry["nickname"], "cumulative_score": entry["cumulative_score"], "rank": entry["rank"]}
+        for entry in get_rank_table().top(limit)
+    ]
+    return jsonify(leaderboard_json)
+
+
+@leaderboard_bp.route('/rank/<int:user_id>', methods=['GET'])
+def get_user_rank(user_id: int):
+    """Returns a user's rank and score."""
+    table = get_rank_table()
+    entry = table.rank(user_id)
+    if entry is None:
+        return jsonify({"error": "User not found"}), 404
+    entry["total_players"] = len(table)
+    return jsonify(entry)
+
+
+@leaderboard_bp.route('/around/<int:user_id>', methods=['GET'])
+def get_users_around(user_id: int):
+    """Returns the players ranked just above and below a user (?radius=5 on each side)."""
+    radius = _int_arg('radius', 5, MAX_LIMIT // 2)
+    window = get_rank_table().around(user_id, radius)
+    if window is None:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(window)
+
+
+@leaderboard_bp.route('/me', methods=['GET'])
+@jwt_required()
+def get_my_rank():
+    """Returns the current user's rank and the players around them."""
+    user_id = int(get_jwt_identity())
+    table = get_rank_table()
+    entry = table.rank(user_id)
+    if entry is None:
+        return jsonify({"error": "User not found"}), 404
+    entry["total_players"] = len(table)
+    entry["around"] = table.around(user_id, _int_arg('radius', 5, MAX_LIMIT // 2))
+    return jsonify(entry)
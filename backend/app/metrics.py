@@ -0,0 +1,241 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import psycopg2.extensions
+from flask import Response, g, has_request_context, request
+
+# Statements slower than this are logged with the endpoint that ran them
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# A request that runs a query per row shows up in the upper buckets of this histogram
+QUERIES_PER_REQUEST_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A labelled metric family kept in process memory and rendered in Prometheus text format."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.extend(self._render_sample(label_values, value))
+        return lines
+
+    def _render_sample(self, label_values, value) -> list:
+        return [f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            # Counts are stored per bucket and made cumulative when rendered
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def _render_sample(self, label_values, value) -> list:
+        counts, total = value
+        bucket_labels = self.labels + ('le',)
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, label_values + (le,))} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+registry = []
+
+http_requests = Counter('http_requests_total', 'HTTP requests by endpoint and status code.', ('method', 'endpoint', 'status'))
+http_request_duration = Histogram('http_request_duration_seconds', 'HTTP request latency.', ('method', 'endpoint'))
+http_requests_in_flight = Gauge('http_requests_in_flight', 'HTTP requests currently being served.')
+db_queries = Counter('db_queries_total', 'SQL statements executed.', ('endpoint',))
+db_query_duration = Histogram('db_query_duration_seconds', 'SQL statement latency.', ('endpoint',), QUERY_BUCKETS)
+db_slow_queries = Counter('db_slow_queries_total', f'SQL statements slower than SLOW_QUERY_SECONDS ({SLOW_QUERY_SECONDS}s).', ('endpoint',))
+db_queries_per_request = Histogram('db_queries_per_request', 'SQL statements executed per HTTP request.', ('endpoint',), QUERIES_PER_REQUEST_BUCKETS)
+db_time_per_request = Histogram('db_time_per_request_seconds', 'Time spent in SQL per HTTP request.', ('endpoint',))
+
+
+def current_endpoint() -> str:
+    """The matched route pattern, so /trips/<trip_id>/<service_date> is one series rather than one per trip."""
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def record_query(statement, duration: float):
+    endpoint = current_endpoint()
+    db_queries.inc(endpoint)
+    db_query_duration.observe(endpoint, value=duration)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += duration
+    if duration >= SLOW_QUERY_SECONDS:
+        db_slow_queries.inc(endpoint)
+        print(f"Slow query ({duration:.3f}s, {endpoint}): {_statement_text(statement)}")
+
+
+def _statement_text(statement) -> str:
+    # Log the statement without its parameters, which may hold personal data
+    if isinstance(statement, bytes):
+        statement = statement.decode('utf-8', 'replace')
+    elif not isinstance(statement, str):
+        statement = repr(statement)
+    return re.sub(r'\s+', ' ', statement).strip()[:500]
+
+
+class QueryTimingMixin:
+    """Times every statement run through a cursor."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+
+_instrumented_cursors = {}
+_instrumented_cursors_lock = threading.Lock()
+
+
+def instrumented_cursor_class(cursor_class):
+    """Returns a subclass of cursor_class (e.g. DictCursor) that times its statements."""
+    if issubclass(cursor_class, QueryTimingMixin):
+        return cursor_class
+    with _instrumented_cursors_lock:
+        if cursor_class not in _instrumented_cursors:
+            _instrumented_cursors[cursor_class] = type(f'Timed{cursor_class.__name__}', (QueryTimingMixin, cursor_class), {})
+        return _instrumented_cursors[cursor_class]
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """A connection whose cursors, whatever their cursor_factory, are timed."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = instrumented_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    http_requests_in_flight.inc()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc=None):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    http_requests_in_flight.dec()
+    endpoint = current_endpoint()
+    status = 500 if exc is not None else g.pop('metrics_status', 500)
+    http_requests.inc(request.method, endpoint, str(status))
+    http_request_duration.observe(request.method, endpoint, value=time.perf_counter() - started)
+    db_queries_per_request.observe(endpoint, value=g.pop('db_queries', 0))
+    db_time_per_request.observe(endpoint, value=g.pop('db_seconds', 0.0))
+
+
+def render_metrics(extra_gauges: dict = None, extra_counters: dict = None) -> str:
+    """
+    All metrics in Prometheus text format. extra_gauges and extra_counters map a metric name
+    to (documentation, value), for values read at scrape time such as pool usage; counters
+    are running totals kept elsewhere.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    for kind, extra in (('gauge', extra_gauges), ('counter', extra_counters)):
+        for name, (documentation, value) in (extra or {}).items():
+            lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {_format_value(value)}'])
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_response(extra_gauges: dict = None, extra_counters: dict = None) -> Response:
+    return Response(render_metrics(extra_gauges, extra_counters), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Records latency, status codes, in-flight requests and SQL usage for every request."""
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
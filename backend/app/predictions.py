@@ -2,12 +2,29 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import psycopg2
 import psycopg2.extras
+import base64
+import binascii
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 
-from .auth.routes import get_db_connection
+from .db import get_db_connection
+from . import trips as timetable
 
 predictions_bp = Blueprint('predictions', __name__, url_prefix='/predictions')
 
+VALID_OUTCOMES = ['on_time', 'late', 'early']
+MAX_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# ?result= filters for /predictions/history
+RESULT_FILTERS = {
+    'correct': 't.outcome IS NOT NULL AND p.predicted_outcome = t.outcome',
+    'incorrect': "t.outcome IS NOT NULL AND t.outcome <> 'no_data' AND p.predicted_outcome <> t.outcome",
+    'pending': 't.outcome IS NULL',
+    'void': "t.outcome = 'no_data'",
+}
+
 @predictions_bp.route('', methods=['POST'])
 @jwt_required()
 def create_prediction():
@@ -26,9 +43,8 @@ def create_prediction():
         return jsonify({"error": "Invalid service_date format. Use YYYY-MM-DD."}), 400
 
     # Validate predicted_outcome
-    valid_outcomes = ['on_time', 'late', 'early']
-    if predicted_outcome not in valid_outcomes:
-        return jsonify({"error": f"predicted_outcome must be one of: {', '.join(valid_outcomes)}"}), 400
+    if predicted_outcome not in VALID_OUTCOMES:
+        return jsonify({"error": f"predicted_outcome must be one of: {', '.join(VALID_OUTCOMES)}"}), 400
 
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
@@ -68,25 +84,214 @@ def create_prediction():
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
     finally:
         cur.close()
-        conn.close()
+
+@predictions_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def create_predictions_batch():
+    """
+    Creates up to MAX_BATCH_SIZE predictions in one request.
+
+    Items are validated against the in-memory timetable and inserted with a single
+    statement; each item gets its own status: created, duplicate, trip_not_found or invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('predictions')
+    user_id = get_jwt_identity()
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "predictions must be a non-empty list"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} predictions can be submitted per batch"}), 400
+
+    loaded = timetable.get_timetable()
+    if loaded is None:
+        return timetable.timetable_loading_response()
+    trip_index = loaded.trip_index
+    results = []
+    to_insert = {}
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        gtfs_trip_id = item.get('trip_id')
+        service_date_str = item.get('service_date')
+        predicted_outcome = item.get('predicted_outcome')
+        result = {'trip_id': gtfs_trip_id, 'service_date': service_date_str, 'predicted_outcome': predicted_outcome}
+        results.append(result)
+
+        if not all([gtfs_trip_id, service_date_str, predicted_outcome]):
+            result.update(status='invalid', error='trip_id, service_date, and predicted_outcome are required')
+            continue
+        if not all(isinstance(value, str) for value in (gtfs_trip_id, service_date_str, predicted_outcome)):
+            result.update(status='invalid', error='trip_id, service_date, and predicted_outcome must be strings')
+            continue
+        try:
+            service_date = datetime.strptime(service_date_str, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            result.update(status='invalid', error='Invalid service_date format. Use YYYY-MM-DD.')
+            continue
+        if predicted_outcome not in VALID_OUTCOMES:
+            result.update(status='invalid', error=f"predicted_outcome must be one of: {', '.join(VALID_OUTCOMES)}")
+            continue
+        if (gtfs_trip_id, service_date.isoformat()) not in trip_index:
+            result.update(status='trip_not_found', error='Trip not found for the given service_date')
+            continue
+
+        key = (gtfs_trip_id, service_date)
+        if key in to_insert:
+            result.update(status='duplicate', error='Trip appears more than once in this batch')
+            continue
+        result['service_date'] = service_date.isoformat()
+        to_insert[key] = result
+
+    if to_insert:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            # The unique constraint turns existing predictions into skipped rows instead of errors
+            inserted = psycopg2.extras.execute_values(
+                cur,
+                """
+                INSERT INTO predictions (user_id, trip_id, service_date, predicted_outcome)
+                VALUES %s
+                ON CONFLICT (user_id, trip_id, service_date) DO NOTHING
+                RETURNING id, trip_id, service_date
+                """,
+                [(user_id, trip_id, service_date, to_insert[(trip_id, service_date)]['predicted_outcome'])
+                 for trip_id, service_date in to_insert],
+                page_size=len(to_insert),
+                fetch=True,
+            )
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            return jsonify({"error": f"Database error: {str(e)}"}), 500
+        finally:
+            cur.close()
+
+        for prediction_id, trip_id, service_date in inserted:
+            to_insert.pop((trip_id, service_date)).update(status='created', id=prediction_id)
+        for result in to_insert.values():
+            result.update(status='duplicate', error='You have already made a prediction for this trip on this date')
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    return jsonify({'created': created, 'failed': len(results) - created, 'results': results}), 200
+
+@predictions_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def get_prediction_stats():
+    """Get the user's accuracy, streaks and per-route hit rate from the maintained stats tables"""
+    user_id = get_jwt_identity()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    try:
+        cur.execute(
+            'SELECT total_resolved, correct, current_streak, best_streak, updated_at FROM user_stats WHERE user_id = %s',
+            (user_id,)
+        )
+        row = cur.fetchone()
+        stats = dict(row) if row else {'total_resolved': 0, 'correct': 0, 'current_streak': 0, 'best_streak': 0, 'updated_at': None}
+        stats['incorrect'] = stats['total_resolved'] - stats['correct']
+        stats['accuracy'] = stats['correct'] / stats['total_resolved'] if stats['total_resolved'] else None
+
+        cur.execute('''
+            SELECT s.route_id, r.route_short_name, r.route_long_name, s.total_resolved, s.correct
+            FROM user_route_stats s
+            LEFT JOIN routes r ON r.route_id = s.route_id
+            WHERE s.user_id = %s
+            ORDER BY s.total_resolved DESC, s.route_id
+        ''', (user_id,))
+        stats['routes'] = [
+            dict(route, accuracy=route['correct'] / route['total_resolved'] if route['total_resolved'] else None)
+            for route in cur.fetchall()
+        ]
+        return jsonify(stats)
+
+    except psycopg2.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    finally:
+        cur.close()
+
+def encode_cursor(created_at, prediction_id) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{prediction_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    created_at, prediction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(prediction_id)
+
+def parse_page_args():
+    """
+    Reads ?limit=&after=&from=&to= into (limit, conditions, params).
+
+    Pages are ordered newest first by (created_at, id); `after` is the opaque cursor from the
+    previous page's X-Next-Cursor header, so each page is an index range scan rather than an OFFSET.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+    conditions, params = [], []
+    after = request.args.get('after')
+    if after:
+        try:
+            conditions.append('(p.created_at, p.id) < (%s, %s)')
+            params.extend(decode_cursor(after))
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise ValueError("Invalid cursor")
+
+    for arg, operator in (('from', '>='), ('to', '<=')):
+        value = request.args.get(arg)
+        if value:
+            try:
+                params.append(datetime.strptime(value, '%Y-%m-%d').date())
+            except ValueError:
+                raise ValueError(f"Invalid {arg} date format. Use YYYY-MM-DD.")
+            conditions.append(f'p.service_date {operator} %s')
+
+    return limit, conditions, params
+
+def paginated_response(rows, limit):
+    """Serializes one page; the cursor for the next page goes in X-Next-Cursor and Link headers."""
+    predictions = [dict(row) for row in rows[:limit]]
+
+    # Convert service_date to string for JSON serialization
+    for p in predictions:
+        if 'service_date' in p and hasattr(p['service_date'], 'isoformat'):
+            p['service_date'] = p['service_date'].isoformat()
+
+    response = jsonify(predictions)
+    # One extra row was fetched to know whether another page exists
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        cursor = encode_cursor(last['created_at'], last['id'])
+        response.headers['X-Next-Cursor'] = cursor
+        args = request.args.to_dict()
+        args.update(after=cursor, limit=limit)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
 
 @predictions_bp.route('', methods=['GET'])
 @jwt_required()
 def get_predictions():
     user_id = get_jwt_identity()
+    try:
+        limit, conditions, params = parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
     try:
-        cur.execute('SELECT id, trip_id, service_date, predicted_outcome, created_at FROM predictions WHERE user_id = %s ORDER BY created_at DESC', (user_id,))
-        predictions = [dict(row) for row in cur.fetchall()]
-        
-        # Convert service_date to string for JSON serialization
-        for p in predictions:
-            if 'service_date' in p and hasattr(p['service_date'], 'isoformat'):
-                p['service_date'] = p['service_date'].isoformat()
-        
-        return jsonify(predictions)
+        where = ' AND '.join(['p.user_id = %s'] + conditions)
+        cur.execute(f'''
+            SELECT p.id, p.trip_id, p.service_date, p.predicted_outcome, p.created_at
+            FROM predictions p
+            WHERE {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        ''', [user_id] + params + [limit + 1])
+        return paginated_response(cur.fetchall(), limit)
         
     except psycopg2.Error as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
@@ -94,19 +299,30 @@ def get_predictions():
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
     finally:
         cur.close()
-        conn.close()
 
 @predictions_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_prediction_history():
-    """Get predictions with their outcomes (correct/incorrect)"""
+    """Get predictions with their outcomes (correct/incorrect), newest first, one page at a time"""
     user_id = get_jwt_identity()
+    try:
+        limit, conditions, params = parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result_filter = request.args.get('result')
+    if result_filter:
+        if result_filter not in RESULT_FILTERS:
+            return jsonify({"error": f"result must be one of: {', '.join(RESULT_FILTERS)}"}), 400
+        conditions.append(RESULT_FILTERS[result_filter])
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
     try:
         # Join predictions with trips to get actual outcomes
-        cur.execute('''
+        where = ' AND '.join(['p.user_id = %s'] + conditions)
+        cur.execute(f'''
             SELECT 
                 p.id,
                 p.trip_id,
@@ -117,23 +333,17 @@ def get_prediction_history():
                 t.trip_headsign,
                 CASE 
                     WHEN t.outcome IS NULL THEN NULL
+                    WHEN t.outcome = 'no_data' THEN 'void'
                     WHEN p.predicted_outcome = t.outcome THEN 'correct'
                     ELSE 'incorrect'
                 END as prediction_result
             FROM predictions p
             LEFT JOIN trips t ON p.trip_id = t.trip_id AND p.service_date = t.service_date
-            WHERE p.user_id = %s 
-            ORDER BY p.created_at DESC
-        ''', (user_id,))
-        
-        predictions = [dict(row) for row in cur.fetchall()]
-        
-        # Convert service_date to string for JSON serialization
-        for p in predictions:
-            if 'service_date' in p and hasattr(p['service_date'], 'isoformat'):
-                p['service_date'] = p['service_date'].isoformat()
-        
-        return jsonify(predictions)
+            WHERE {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        ''', [user_id] + params + [limit + 1])
+        return paginated_response(cur.fetchall(), limit)
         
     except psycopg2.Error as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
@@ -141,4 +351,3 @@ def get_prediction_history():
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+import requests
+from google.transit import gtfs_realtime_pb2
+
+# Only the resolver leader works with realtime updates, so pandas is imported where it is used
+if TYPE_CHECKING:
+    import pandas as pd
+
+# GTFS-realtime TripUpdates source; a local .pb file (re-read on every poll) stands in for the live feed
+GTFS_RT_URL = os.environ.get('GTFS_RT_URL')
+GTFS_RT_FILE = os.environ.get('GTFS_RT_FILE')
+POLL_SECONDS = float(os.environ.get('GTFS_RT_POLL_SECONDS', 30))
+
+# A trip is late/early when its last-stop delay is beyond these many seconds
+LATE_THRESHOLD_SECONDS = int(os.environ.get('REALTIME_LATE_SECONDS', 180))
+EARLY_THRESHOLD_SECONDS = int(os.environ.get('REALTIME_EARLY_SECONDS', 60))
+
+# How long past its resolution deadline a trip waits for realtime data before being voided
+MAX_WAIT = timedelta(minutes=int(os.environ.get('REALTIME_MAX_WAIT_MINUTES', 60)))
+
+# Outcome for trips the feed never reported; their predictions are not scored
+NO_DATA = 'no_data'
+
+UPDATE_KEY = ['trip_id', 'service_date']
+UPDATE_COLUMNS = UPDATE_KEY + ['stop_sequence', 'delay', 'observed_at']
+
+# (trip_id, service_date) -> the update for the furthest stop seen across polls. Trips
+# drop out of the feed once they finish, so the last report has to be remembered.
+# None until the first poll.
+latest_updates = None
+latest_updates_lock = threading.Lock()
+
+
+def feed_configured() -> bool:
+    return bool(GTFS_RT_URL or GTFS_RT_FILE)
+
+
+def fetch_feed() -> bytes:
+    if GTFS_RT_FILE:
+        with open(GTFS_RT_FILE, 'rb') as f:
+            return f.read()
+    resp = requests.get(GTFS_RT_URL, timeout=20)
+    resp.raise_for_status()
+    return resp.content
+
+
+def parse_trip_updates(content: bytes) -> pd.DataFrame:
+    """Returns one row per trip with the delay at the furthest stop in a FeedMessage."""
+    import pandas as pd
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    observed_at = feed.header.timestamp or int(datetime.now().timestamp())
+    fallback_date = datetime.fromtimestamp(observed_at).strftime('%Y%m%d')
+
+    trip_ids, service_dates, stop_sequences, delays = [], [], [], []
+    for entity in feed.entity:
+        if not entity.HasField('trip_update'):
+            continue
+        trip_update = entity.trip_update
+        # Updates are ordered by stop; the last one with a delay is the furthest along the trip
+        for stop in reversed(trip_update.stop_time_update):
+            if stop.HasField('arrival') and stop.arrival.HasField('delay'):
+                delay = stop.arrival.delay
+            elif stop.HasField('departure') and stop.departure.HasField('delay'):
+                delay = stop.departure.delay
+            else:
+                continue
+            trip_ids.append(trip_update.trip.trip_id)
+            service_dates.append(trip_update.trip.start_date or fallback_date)
+            stop_sequences.append(stop.stop_sequence)
+            delays.append(delay)
+            break
+
+    return pd.DataFrame({
+        'trip_id': trip_ids,
+        'service_date': pd.to_datetime(pd.Series(service_dates, dtype=str), format='%Y%m%d').dt.date,
+        'stop_sequence': pd.Series(stop_sequences, dtype='int64'),
+        'delay': pd.Series(delays, dtype='int64'),
+        'observed_at': observed_at,
+    })
+
+
+def merge_updates(current: pd.DataFrame, snapshot: pd.DataFrame, oldest_date) -> pd.DataFrame:
+    """Keeps, per trip, the furthest stop reported; newer reports win at the same stop."""
+    import pandas as pd
+
+    combined = pd.concat([current, snapshot], ignore_index=True) if current is not None else snapshot
+    combined = combined[combined['service_date'] >= oldest_date]
+    combined = combined.sort_values(['stop_sequence', 'observed_at'], kind='stable')
+    return combined.drop_duplicates(subset=UPDATE_KEY, keep='last').reset_index(drop=True)
+
+
+def poll_realtime_feed():
+    """Fetches one feed snapshot and folds it into latest_updates."""
+    global latest_updates
+    if not feed_configured():
+        return
+
+    try:
+        snapshot = parse_trip_updates(fetch_feed())
+    except Exception as e:
+        print(f"Error polling realtime feed: {e}")
+        return
+
+    # Yesterday's trips can still be finishing after midnight
+    oldest_date = datetime.now().date() - timedelta(days=1)
+    with latest_updates_lock:
+        latest_updates = merge_updates(latest_updates, snapshot, oldest_date)
+        tracked = len(latest_updates)
+    print(f"Polled realtime feed: {len(snapshot)} trip updates, {tracked} trips tracked.")
+
+
+def classify_delays(delays: pd.Series) -> pd.Series:
+    import pandas as pd
+
+    outcomes = pd.Series('on_time', index=delays.index)
+    outcomes[delays > LATE_THRESHOLD_SECONDS] = 'late'
+    outcomes[delays < -EARLY_THRESHOLD_SECONDS] = 'early'
+    return outcomes
+
+
+def determine_outcomes(due: pd.DataFrame, updates: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """
+    Joins the latest realtime delay onto due trips and decides each one.
+
+    due has trip_id, service_date, deadline and last_stop_sequence. Returns due with an
+    outcome column: a delay class once the feed has reported the trip's last stop (or its
+    furthest stop after MAX_WAIT), NO_DATA after MAX_WAIT without any report, and None
+    for trips that should wait for another poll.
+    """
+    joined = due.merge(updates[UPDATE_KEY + ['stop_sequence', 'delay']], on=UPDATE_KEY, how='left')
+    reported = joined['delay'].notna()
+    reached_last_stop = reported & (joined['stop_sequence'] >= joined['last_stop_sequence'].astype(float).fillna(0))
+    expired = (joined['deadline'] + MAX_WAIT) <= now
+
+    joined['outcome'] = None
+    decided = reached_last_stop | (reported & expired)
+    joined.loc[decided, 'outcome'] = classify_delays(joined.loc[decided, 'delay'])
+    joined.loc[~reported & expired, 'outcome'] = NO_DATA
+    return joined
+
+
+def current_updates() -> pd.DataFrame:
+    with latest_updates_lock:
+        updates = latest_updates
+    if updates is None:
+        import pandas as pd
+        return pd.DataFrame(columns=UPDATE_COLUMNS)
+    return updates
@@ -1,87 +1,179 @@
+import os
 import random
-import psycopg2
-import psycopg2.extras
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import current_app
 
-from .auth.routes import get_db_connection
-from .trips import update_scores
+import psycopg2
+
+from .db import get_db_connection, connection_params
+from . import trips as timetable
+from .trips import resolve_trips, pop_due_trips, requeue_trips, next_resolution_time, resolution_queue_changed, RESOLUTION_DELAY
+from .realtime import feed_configured, current_updates, determine_outcomes, poll_realtime_feed, POLL_SECONDS as REALTIME_POLL_SECONDS
+
+# "embedded": every web process runs a resolver candidate and one of them leads.
+# "external": web processes leave resolution to `python worker.py`.
+RESOLVER_MODE = os.environ.get('RESOLVER_MODE', 'embedded')
+
+# Session-level advisory lock held by the leading resolver; released by Postgres if its process dies
+LEADER_LOCK_KEY = 0x7265736F
+# How often followers try to take over leadership
+LEADER_RETRY_SECONDS = float(os.environ.get('RESOLVER_LEADER_RETRY_SECONDS', 15))
+# Upper bound on the leader's sleep, so it re-checks its lock connection regularly
+MAX_SLEEP_SECONDS = 60
+MIN_SLEEP_SECONDS = 1
+
+# A failed run is retried after this long
+RETRY_AFTER_ERROR = timedelta(minutes=1)
+
+def realtime_resolutions(due_entries: list, now: datetime) -> tuple:
+    """
+    Decides due trips from the latest realtime delays in one join.
+
+    Returns (resolutions, waiting): (trip_id, service_date, outcome) rows to apply, and the
+    queue entries still waiting for the feed to report their last stop.
+    """
+    import pandas as pd
+
+    due = pd.DataFrame(due_entries, columns=['check_at', 'trip_id', 'service_date'])
+    # Includes trips carried over from an earlier timetable window, e.g. yesterday's after-midnight trips
+    last_stops = timetable.get_resolution_last_stops()
+    due = due.merge(last_stops, on=['trip_id', 'service_date'], how='left')
+
+    # The wait for realtime data counts from the original resolution deadline, not the last check
+    due['deadline'] = (
+        pd.to_datetime(due['service_date'])
+        + pd.to_timedelta(due['last_stop_arrival_seconds'].astype(float), unit='s')
+        + RESOLUTION_DELAY
+    ).fillna(due['check_at'])
 
-def resolve_pending_trips(app, trips_data, stop_times_data): # Accept app and dataframes as arguments
+    decided = determine_outcomes(due, current_updates(), now)
+    has_outcome = decided['outcome'].notna().to_numpy()
+    resolutions = list(decided.loc[has_outcome, ['trip_id', 'service_date', 'outcome']].itertuples(index=False, name=None))
+    waiting = [entry for entry, done in zip(due_entries, has_outcome) if not done]
+    return resolutions, waiting
+
+def resolve_pending_trips(app):
     """
-    Simulates trip outcomes for pending trips and updates the database.
+    Resolves trips whose resolution deadline has passed from realtime delays and updates the database.
     """
     with app.app_context(): # Use the passed app instance to push the application context
         print("Running resolver to check for pending trips...")
-        
-        # Dataframes are now passed as arguments, no need to load them here
-        # from .trips import load_data_from_db, stop_times_df, trips_df
-        # load_data_from_db()
-        
-        conn = None
+
+        # --- 1. Pop only the trips whose resolution deadline has passed ---
+        now = datetime.now()
+        unresolved_trips_due = pop_due_trips(now)
+        print(f"Found {len(unresolved_trips_due)} unresolved trips due for resolution.")
+
+        if not unresolved_trips_due:
+            print("No unresolved trips due to process.")
+            return
+
+        waiting = []
         try:
-            conn = get_db_connection()
-            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-            # --- 1. Get unresolved trips from the database that are due for resolution ---
-            # We need to iterate through trips_data to find trips that are due
-            unresolved_trips_due = []
-            for idx, trip_row in trips_data[trips_data['outcome'].isnull()].iterrows():
-                trip_id = trip_row['trip_id']
-                service_date = trip_row['service_date']
-
-                trip_stops = stop_times_data[(stop_times_data['trip_id'] == trip_id) & (stop_times_data['service_date'] == service_date)]
-
-                if trip_stops.empty:
-                    # print(f"Could not find stop times for trip {trip_id} on {service_date}. Skipping for resolution check.")
-                    continue
-                
-                last_stop = trip_stops.sort_values(by='stop_sequence').iloc[-1]
-                last_stop_arrival_time_str = last_stop['arrival_time']
-                
-                try:
-                    h, m, s = map(int, last_stop_arrival_time_str.split(':'))
-                    scheduled_arrival_datetime = datetime(service_date.year, service_date.month, service_date.day, 0, 0, 0) + timedelta(hours=h, minutes=m, seconds=s)
-                    resolution_window_end = scheduled_arrival_datetime + timedelta(minutes=5)
-
-                    if datetime.now() >= resolution_window_end:
-                        unresolved_trips_due.append({'trip_id': trip_id, 'service_date': service_date})
-                except ValueError:
-                    print(f"Could not parse arrival time for trip {trip_id} on {service_date}. Skipping for resolution check.")
-                    continue
-
-            print(f"Found {len(unresolved_trips_due)} unresolved trips due for resolution.")
-
-            if not unresolved_trips_due:
-                print("No unresolved trips due to process.")
+            # --- 2. Determine trip outcomes ---
+            if feed_configured():
+                resolutions, waiting = realtime_resolutions(unresolved_trips_due, now)
+                # Check again after the next feed poll; they are voided once the maximum wait has passed
+                retry_at = now + timedelta(seconds=REALTIME_POLL_SECONDS)
+                requeue_trips([(retry_at, trip_id, service_date) for _, trip_id, service_date in waiting])
+                if waiting:
+                    print(f"{len(waiting)} trips are waiting for realtime data.")
+            else:
+                print("No realtime feed configured (GTFS_RT_URL or GTFS_RT_FILE); simulating outcomes.")
+                resolutions = [
+                    (trip_id, service_date, random.choice(["on_time", "late"]))
+                    for deadline, trip_id, service_date in unresolved_trips_due
+                ]
+
+            if not resolutions:
                 return
 
-            updates_processed = 0
-            for trip_db in unresolved_trips_due:
-                trip_id = trip_db['trip_id']
-                service_date = trip_db['service_date']
-
-                # --- 3. Simulate trip outcome ---
-                outcome = random.choice(["on_time", "late"])
-                
-                # --- 4. Update trip outcome in the database ---
-                cur.execute(
-                    'UPDATE trips SET outcome = %s WHERE trip_id = %s AND service_date = %s',
-                    (outcome, trip_id, service_date)
-                )
-                conn.commit()
-                print(f"Resolved trip {trip_id} on {service_date} with simulated outcome: {outcome}")
-
-                # --- 5. Score predictions ---
-                update_scores(trip_id, service_date, outcome)
-                updates_processed += 1
-
-            cur.close()
-            conn.close()
-            print(f"Finished processing. {updates_processed} trips were resolved.")
+            # --- 3. Update outcomes and score predictions in one transaction ---
+            conn = get_db_connection()
+            counts = resolve_trips(conn, resolutions)
+            print(
+                f"Finished processing. {counts['trips_resolved']} trips were resolved, "
+                f"{counts['predictions_scored']} correct predictions credited to {counts['users_credited']} users, "
+                f"{counts['stats_updated']} user stats updated, {counts['results_queued']} results queued for digest emails."
+            )
 
         except Exception as e:
             print(f"An error occurred during trip resolution: {e}")
-        finally:
-            if conn:
-                conn.close()
+            # Retry shortly; already-resolved trips are skipped by resolve_trips
+            waiting = set(waiting)
+            retry = [entry for entry in unresolved_trips_due if entry not in waiting]
+            retry_at = now + RETRY_AFTER_ERROR
+            requeue_trips([(retry_at, trip_id, service_date) for _, trip_id, service_date in retry])
+
+class ResolverLeader(threading.Thread):
+    """
+    Runs the resolver in exactly one process across all web workers and hosts.
+
+    Each candidate tries to take a Postgres session-level advisory lock on a dedicated
+    connection. The holder sleeps until the next resolution deadline (or the next realtime
+    poll) and resolves what is due; the others retry every LEADER_RETRY_SECONDS. If the
+    leader's process or connection dies, Postgres releases the lock and a follower takes over.
+    """
+
+    def __init__(self, app):
+        super().__init__(name='resolver-leader', daemon=True)
+        self.app = app
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+        resolution_queue_changed.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute('SELECT pg_try_advisory_lock(%s)', (LEADER_LOCK_KEY,))
+                    is_leader = cur.fetchone()[0]
+                if is_leader:
+                    print(f"Resolver leadership acquired by process {os.getpid()}.")
+                    self._lead(conn)
+            except psycopg2.Error as e:
+                print(f"Resolver leader connection lost: {e}")
+            except Exception as e:
+                print(f"Resolver leader error: {e}")
+            finally:
+                # Closing the session releases the lock for the next candidate
+                if conn is not None and not conn.closed:
+                    conn.close()
+            self._stopping.wait(LEADER_RETRY_SECONDS)
+
+    def _lead(self, conn):
+        next_poll = time.monotonic()
+        while not self._stopping.is_set():
+            # Confirm the session holding the lock is still alive before acting as leader
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+
+            if feed_configured() and time.monotonic() >= next_poll:
+                poll_realtime_feed()
+                next_poll = time.monotonic() + REALTIME_POLL_SECONDS
+
+            resolve_pending_trips(self.app)
+
+            # Sleep until the next deadline; new or requeued trips wake us early
+            resolution_queue_changed.clear()
+            sleep = MAX_SLEEP_SECONDS
+            next_time = next_resolution_time()
+            if next_time is not None:
+                sleep = min(sleep, (next_time - datetime.now()).total_seconds())
+            if feed_configured():
+                sleep = min(sleep, next_poll - time.monotonic())
+            resolution_queue_changed.wait(max(sleep, MIN_SLEEP_SECONDS))
+
+def start_resolver(app):
+    """Starts this process's resolver candidate; returns it, or None when resolution runs elsewhere."""
+    if RESOLVER_MODE != 'embedded':
+        return None
+    leader = ResolverLeader(app)
+    leader.start()
+    return leader
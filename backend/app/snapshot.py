@@ -0,0 +1,142 @@
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pyarrow.feather as feather
+
+# Timetable snapshots live in SNAPSHOT_DIR/<name>/, with SNAPSHOT_DIR/CURRENT naming the one to serve.
+# Every worker process on the host memory-maps the same files instead of holding its own copy.
+SNAPSHOT_DIR = os.environ.get('TIMETABLE_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'timetable-snapshots'))
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+# Older snapshots kept besides the current one; processes that have not swapped yet still map them
+KEEP_SNAPSHOTS = 2
+
+
+class Snapshot:
+    """A published timetable snapshot: Arrow tables memory-mapped read-only, plus raw files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        self.version = self.metadata['version']
+        self._tables = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str):
+        """The named table as a pyarrow.Table backed by the shared page cache (no copy)."""
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = feather.read_table(os.path.join(self.path, f'{name}.arrow'), memory_map=True)
+            return self._tables[name]
+
+    def frame(self, name: str):
+        """The named table as a pandas DataFrame. This copies it into the process, so only use it off the request path."""
+        table = self.table(name)
+        with self._lock:
+            if name not in self._frames:
+                self._frames[name] = table.to_pandas()
+            return self._frames[name]
+
+    def read_bytes(self, name: str) -> bytes:
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def map_bytes(self, name: str) -> mmap.mmap:
+        """A raw file mapped read-only, so its pages are shared by every process serving it (no copy)."""
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def current_snapshot_name(snapshot_dir: str = SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_current_snapshot(snapshot_dir: str = SNAPSHOT_DIR):
+    """Opens the snapshot CURRENT points at, or returns None if none has been published."""
+    name = current_snapshot_name(snapshot_dir)
+    if name is None:
+        return None
+    return Snapshot(os.path.join(snapshot_dir, name))
+
+
+def read_current_metadata(snapshot_dir: str = SNAPSHOT_DIR):
+    name = current_snapshot_name(snapshot_dir)
+    if name is None:
+        return None
+    try:
+        with open(os.path.join(snapshot_dir, name, 'metadata.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def build_lock(snapshot_dir: str = SNAPSHOT_DIR):
+    """Serializes snapshot builds across the processes on this host."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, LOCK_FILE), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_snapshot(tables: dict, files: dict, metadata: dict, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """
+    Writes DataFrames as Arrow files and raw bytes as files into a new snapshot, then points
+    CURRENT at it. Call under build_lock(); returns the new snapshot's name.
+    """
+    previous = read_current_metadata(snapshot_dir)
+    version = (previous['version'] if previous else 0) + 1
+    name = f'v{version:06d}'
+
+    # Build in a temporary directory so readers never see a half-written snapshot
+    path = os.path.join(snapshot_dir, name)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for table_name, frame in tables.items():
+        # Uncompressed, so the columns can be memory-mapped without decoding
+        feather.write_feather(frame, os.path.join(tmp_path, f'{table_name}.arrow'), compression='uncompressed')
+    for file_name, content in files.items():
+        with open(os.path.join(tmp_path, file_name), 'wb') as f:
+            f.write(content)
+
+    metadata = dict(metadata, version=version, built_at=time.time(), rows={table_name: len(frame) for table_name, frame in tables.items()})
+    with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.rename(tmp_path, path)
+
+    current_tmp = os.path.join(snapshot_dir, CURRENT_FILE + '.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(snapshot_dir, CURRENT_FILE))
+
+    prune_snapshots(snapshot_dir, keep=name)
+    return name
+
+
+def prune_snapshots(snapshot_dir: str = SNAPSHOT_DIR, keep: str = None):
+    """Deletes all but the newest KEEP_SNAPSHOTS older snapshots. Files still mapped by a process stay readable until it unmaps them."""
+    names = sorted(
+        entry for entry in os.listdir(snapshot_dir)
+        if entry.startswith('v') and not entry.endswith('.tmp') and entry != keep
+    )
+    for name in names[:-KEEP_SNAPSHOTS] if KEEP_SNAPSHOTS else names:
+        shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
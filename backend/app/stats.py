@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import io
+from typing import TYPE_CHECKING
+
+import psycopg2.extras
+
+# Only the stats rebuild needs pandas; it is imported there so web workers start without it
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Streaks follow this order within a user: service day, then the order predictions were made
+STREAK_ORDER = ['service_date', 'created_at', 'prediction_id']
+
+
+def update_user_stats(cur, resolved_predictions: list) -> int:
+    """
+    Folds newly resolved predictions into user_stats and user_route_stats.
+
+    resolved_predictions are dicts with user_id, prediction_id, created_at, service_date,
+    route_id and correct. Runs in the caller's (scoring) transaction; returns the number
+    of users updated.
+    """
+    if not resolved_predictions:
+        return 0
+
+    user_ids = sorted({row['user_id'] for row in resolved_predictions})
+    # Lock the rows so a concurrent run cannot interleave streak updates
+    cur.execute(
+        'SELECT user_id, current_streak, best_streak FROM user_stats WHERE user_id = ANY(%s) FOR UPDATE',
+        (user_ids,)
+    )
+    streaks = {user_id: (current, best) for user_id, current, best in cur.fetchall()}
+
+    user_rows = {}
+    route_counts = {}
+    ordered = sorted(resolved_predictions, key=lambda row: (row['user_id'],) + tuple(row[key] for key in STREAK_ORDER))
+    for row in ordered:
+        user_id, correct = row['user_id'], bool(row['correct'])
+        current, best = streaks.get(user_id, (0, 0))
+        current = current + 1 if correct else 0
+        streaks[user_id] = (current, max(best, current))
+
+        total, correct_count = user_rows.get(user_id, (0, 0))
+        user_rows[user_id] = (total + 1, correct_count + correct)
+
+        if row['route_id'] is not None:
+            key = (user_id, row['route_id'])
+            total, correct_count = route_counts.get(key, (0, 0))
+            route_counts[key] = (total + 1, correct_count + correct)
+
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO user_stats (user_id, total_resolved, correct, current_streak, best_streak)
+        VALUES %s
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_resolved = user_stats.total_resolved + EXCLUDED.total_resolved,
+            correct = user_stats.correct + EXCLUDED.correct,
+            current_streak = EXCLUDED.current_streak,
+            best_streak = EXCLUDED.best_streak,
+            updated_at = NOW()
+    """, [
+        (user_id, total, correct_count) + streaks[user_id]
+        for user_id, (total, correct_count) in user_rows.items()
+    ], page_size=len(user_rows))
+
+    if not route_counts:
+        return len(user_rows)
+
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO user_route_stats (user_id, route_id, total_resolved, correct)
+        VALUES %s
+        ON CONFLICT (user_id, route_id) DO UPDATE SET
+            total_resolved = user_route_stats.total_resolved + EXCLUDED.total_resolved,
+            correct = user_route_stats.correct + EXCLUDED.correct
+    """, [
+        (user_id, route_id, total, correct_count)
+        for (user_id, route_id), (total, correct_count) in route_counts.items()
+    ], page_size=len(route_counts))
+
+    return len(user_rows)
+
+
+def compute_user_stats(predictions: pd.DataFrame) -> tuple:
+    """
+    Vectorized rebuild of (user_stats, user_route_stats) frames from every resolved prediction.
+
+    predictions needs user_id, prediction_id, created_at, service_date, route_id and correct.
+    """
+    import pandas as pd
+
+    df = predictions.sort_values(['user_id'] + STREAK_ORDER, kind='stable').reset_index(drop=True)
+    correct = df['correct'].astype(bool)
+
+    # Every miss starts a new run, so a row's streak is the running count of hits within its run
+    hits = correct.astype(int)
+    run_id = (~correct).astype(int).groupby(df['user_id']).cumsum()
+    streak = hits.groupby([df['user_id'], run_id]).cumsum()
+    df = df.assign(correct=hits, streak=streak)
+
+    by_user = df.groupby('user_id')
+    user_stats = pd.DataFrame({
+        'total_resolved': by_user.size(),
+        'correct': by_user['correct'].sum(),
+        'current_streak': by_user['streak'].last(),
+        'best_streak': by_user['streak'].max(),
+    }).reset_index()
+
+    route_stats = (
+        df.groupby(['user_id', 'route_id'])
+        .agg(total_resolved=('correct', 'size'), correct=('correct', 'sum'))
+        .reset_index()
+    )
+    return user_stats, route_stats
+
+
+def rebuild_user_stats(conn) -> dict:
+    """Recomputes both stats tables from prediction history in one transaction."""
+    import pandas as pd
+
+    try:
+        with conn.cursor() as cur:
+            # Block resolver updates until the rebuilt tables are in place
+            cur.execute('LOCK TABLE user_stats, user_route_stats IN EXCLUSIVE MODE')
+            cur.execute("""
+                SELECT p.user_id, p.id AS prediction_id, p.created_at, p.service_date, t.route_id,
+                       p.predicted_outcome = t.outcome AS correct
+                FROM predictions p
+                JOIN trips t ON t.trip_id = p.trip_id AND t.service_date = p.service_date
+                WHERE t.outcome IS NOT NULL AND t.outcome <> 'no_data'
+            """)
+            columns = [desc[0] for desc in cur.description]
+            predictions = pd.DataFrame(cur.fetchall(), columns=columns)
+
+            cur.execute('TRUNCATE user_stats, user_route_stats')
+            if not predictions.empty:
+                user_stats, route_stats = compute_user_stats(predictions)
+                _copy_frame(cur, 'user_stats', user_stats)
+                _copy_frame(cur, 'user_route_stats', route_stats)
+            else:
+                user_stats = route_stats = pd.DataFrame()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        "predictions": len(predictions),
+        "users": len(user_stats),
+        "user_routes": len(route_stats),
+    }
+
+
+def _copy_frame(cur, table, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(f'COPY {table} ({", ".join(df.columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
@@ -1,145 +1,584 @@
+from __future__ import annotations
+
 import os
-import pandas as pd
-from flask import Blueprint, jsonify
-from sqlalchemy import create_engine
+import gzip
+import hashlib
+import heapq
+import json
+import threading
+from typing import TYPE_CHECKING
+
+import psycopg2.extras
+from flask import Blueprint, jsonify, request, Response
 from datetime import datetime, timedelta
 
+from .db import pooled_connection
+from .leaderboard import record_score_changes, score_changes_lock
+from .email_service import queue_prediction_results
+from .stats import update_user_stats
+from .realtime import NO_DATA
+from .snapshot import build_lock, current_snapshot_name, open_current_snapshot, read_current_metadata, write_snapshot
+
+# pandas is only needed to build a snapshot and by the resolver; requests are served from
+# the memory-mapped Arrow tables, so it is imported where it is used
+if TYPE_CHECKING:
+    import pandas as pd
+
 # Blueprint definition
 trips_bp = Blueprint('trips', __name__, url_prefix='/trips')
 
-# Global DataFrames to hold the data
-trips_df = pd.DataFrame()
-stops_df = pd.DataFrame()
-routes_df = pd.DataFrame()
-calendar_df = pd.DataFrame()
-stop_times_df = pd.DataFrame()
-trips_with_stops_df = pd.DataFrame()
-
-def get_db_connection():
-    # This function is needed for update_scores
-    import psycopg2
-    import os
-    return psycopg2.connect(
-        host=os.environ.get('POSTGRES_HOST'),
-        database=os.environ.get('POSTGRES_DB'),
-        user=os.environ.get('POSTGRES_USER'),
-        password=os.environ.get('POSTGRES_PASSWORD')
+# The timetable this process serves; replaced as a whole on every data load (see get_timetable)
+_timetable = None
+
+# Bumped when the snapshot tables change shape, so snapshots written by older code are rebuilt
+SNAPSHOT_FORMAT = 2
+
+# Min-heap of (check_at, trip_id, service_date) for unresolved trips; check_at starts at the
+# resolution deadline and is pushed back while a trip waits for realtime data or a retry
+resolution_queue = []
+# Timetable version the queue was built from. It is rebuilt lazily, so only the process that
+# resolves trips (the resolver leader) converts the timetable to pandas.
+resolution_queue_version = None
+resolution_queue_lock = threading.Lock()
+# Last-stop sequence and arrival of every trip the queue can hold, including trips carried over
+# from an earlier timetable window; the resolver reads them to decide realtime outcomes
+resolution_last_stops = None
+# Set whenever entries are added or the queue is rebuilt, so a sleeping resolver can recheck its next wake-up
+resolution_queue_changed = threading.Event()
+
+# Email each user a summary of their resolved predictions, at most one per PREDICTION_DIGEST_WINDOW_MINUTES
+PREDICTION_DIGEST_EMAILS = os.environ.get('PREDICTION_DIGEST_EMAILS', 'true').lower() == 'true'
+
+# Trips are resolved this long after their scheduled last-stop arrival
+RESOLUTION_DELAY = timedelta(minutes=5)
+
+# Memory-mapped payloads are written to the client this many bytes at a time
+PAYLOAD_CHUNK_BYTES = 256 * 1024
+
+class TripsPayload:
+    """
+    A sorted, JSON-encoded /trips body with its gzip variant and ETags. The bodies may be
+    bytes or memory-mapped snapshot files; either way they are streamed in chunks.
+    """
+
+    def __init__(self, body, version: int, gzip_body=None):
+        self.body = body
+        self.gzip_body = gzip_body if gzip_body is not None else gzip.compress(body, compresslevel=6)
+        self.version = version
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        self.etag = f'v{version}-{digest}'
+        # A compressed representation needs its own entity tag
+        self.gzip_etag = f'{self.etag}-gz'
+
+    def stream(self, gzipped: bool):
+        """Yields the body in PAYLOAD_CHUNK_BYTES pieces; only the piece being sent is copied out of the mapping."""
+        view = memoryview(self.gzip_body if gzipped else self.body)
+        for start in range(0, len(view), PAYLOAD_CHUNK_BYTES):
+            yield bytes(view[start:start + PAYLOAD_CHUNK_BYTES])
+
+class TripIndex:
+    """
+    (trip_id, service_date ISO string) -> JSON-ready trip record. Only the key -> row mapping
+    lives in the process; records are read from the memory-mapped trips table on lookup.
+    """
+
+    def __init__(self, trips):
+        self.trips = trips
+        keys = zip(
+            trips.column('trip_id').to_pylist(),
+            (service_date.isoformat() for service_date in trips.column('service_date').to_pylist()),
+        )
+        self._rows = {key: row for row, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def get(self, key, default=None):
+        row = self._rows.get(key)
+        if row is None:
+            return default
+        record = self.trips.slice(row, 1).to_pylist()[0]
+        record['service_date'] = record['service_date'].isoformat()
+        return record
+
+class Timetable:
+    """One published snapshot, with the /trips payload and trip lookup built from it."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.window = tuple(snapshot.metadata['window'])
+        # Mapped rather than read, so worker processes share one copy of the payloads like the tables
+        self.payload = TripsPayload(snapshot.map_bytes('trips.json'), self.version, snapshot.map_bytes('trips.json.gz'))
+        self.trip_index = TripIndex(snapshot.table('trips'))
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """trips, stop_times, stops, routes, calendar or trips_with_stops as a DataFrame (copied on first use)."""
+        return self.snapshot.frame(name)
+
+def get_timetable():
+    """Returns the timetable this process serves, or None before the first load."""
+    return _timetable
+
+def update_scores(cur, resolved_trips: list) -> dict:
+    """
+    Awards points to users who predicted correctly on the given (trip_id, service_date, outcome)
+    rows, updates their per-user stats and queues the results for digest emails in the same transaction.
+    """
+    if not resolved_trips:
+        return {"users_credited": 0, "predictions_scored": 0, "score_deltas": {}, "stats_updated": 0, "results_queued": 0}
+
+    # One statement credits every correct predictor across all resolved trips
+    credited = psycopg2.extras.execute_values(
+        cur,
+        """
+        UPDATE users u
+        SET cumulative_score = u.cumulative_score + c.points
+        FROM (
+            SELECT p.user_id, COUNT(*) AS points
+            FROM predictions p
+            JOIN (VALUES %s) AS r (trip_id, service_date, outcome)
+              ON p.trip_id = r.trip_id
+             AND p.service_date = r.service_date
+             AND p.predicted_outcome = r.outcome
+            GROUP BY p.user_id
+        ) c
+        WHERE u.id = c.user_id
+        RETURNING u.id, c.points
+        """,
+        resolved_trips,
+        template='(%s, %s::date, %s)',
+        page_size=len(resolved_trips),
+        fetch=True,
     )
 
-def update_scores(trip_id: str, service_date: datetime.date, outcome: str):
-    """Awards points to users who predicted correctly."""
-    conn = get_db_connection()
+    # Every resolved prediction with its owner's new total, for stats and result digests
+    resolved_rows = psycopg2.extras.execute_values(
+        cur,
+        """
+        SELECT p.user_id, u.email, u.nickname, u.cumulative_score,
+               p.id AS prediction_id, p.created_at, p.trip_id, p.service_date,
+               p.predicted_outcome, r.outcome AS actual_outcome,
+               p.predicted_outcome = r.outcome AS correct,
+               t.route_id, t.trip_headsign, rt.route_short_name
+        FROM predictions p
+        JOIN (VALUES %s) AS r (trip_id, service_date, outcome)
+          ON p.trip_id = r.trip_id
+         AND p.service_date = r.service_date
+        JOIN users u ON u.id = p.user_id
+        JOIN trips t ON t.trip_id = p.trip_id AND t.service_date = p.service_date
+        LEFT JOIN routes rt ON rt.route_id = t.route_id
+        """,
+        resolved_trips,
+        template='(%s, %s::date, %s)',
+        page_size=len(resolved_trips),
+        fetch=True,
+    )
+    columns = [desc[0] for desc in cur.description]
+    resolved_predictions = [dict(zip(columns, row)) for row in resolved_rows]
+
+    stats_updated = update_user_stats(cur, resolved_predictions)
+
+    results_queued = 0
+    if PREDICTION_DIGEST_EMAILS:
+        results_queued = queue_prediction_results(cur, resolved_predictions)
+
+    return {
+        "users_credited": len(credited),
+        "predictions_scored": sum(points for _, points in credited),
+        "score_deltas": dict(credited),
+        "stats_updated": stats_updated,
+        "results_queued": results_queued,
+    }
+
+def resolve_trips(conn, resolutions: list) -> dict:
+    """
+    Sets outcomes for (trip_id, service_date, outcome) rows and scores their predictions
+    in a single transaction. Trips that already have an outcome are left untouched and
+    are not scored again, and trips voided for lack of realtime data are not scored at all.
+    """
+    if not resolutions:
+        return {"trips_resolved": 0, "users_credited": 0, "predictions_scored": 0, "score_deltas": {}, "stats_updated": 0, "results_queued": 0}
+
     try:
         with conn.cursor() as cur:
-            # Get predictions for this trip and service_date
-            cur.execute('SELECT user_id, predicted_outcome FROM predictions WHERE trip_id = %s AND service_date = %s', (trip_id, service_date))
-            predictions = cur.fetchall()
-
-            for user_id, predicted_outcome in predictions:
-                if predicted_outcome == outcome:
-                    cur.execute('UPDATE users SET cumulative_score = cumulative_score + 1 WHERE id = %s', (user_id,))
+            resolved_trips = psycopg2.extras.execute_values(
+                cur,
+                """
+                UPDATE trips t
+                SET outcome = r.outcome
+                FROM (VALUES %s) AS r (trip_id, service_date, outcome)
+                WHERE t.trip_id = r.trip_id
+                  AND t.service_date = r.service_date
+                  AND t.outcome IS NULL
+                RETURNING t.trip_id, t.service_date, t.outcome
+                """,
+                resolutions,
+                template='(%s, %s::date, %s)',
+                page_size=len(resolutions),
+                fetch=True,
+            )
+            counts = update_scores(cur, [trip for trip in resolved_trips if trip[2] != NO_DATA])
+        # A leaderboard reload sees both the committed scores and their deltas, or neither
+        with score_changes_lock:
             conn.commit()
-            print(f"Scores updated for trip {trip_id} on {service_date} with outcome {outcome}")
-    except Exception as e:
+            record_score_changes(counts["score_deltas"])
+    except Exception:
         conn.rollback()
-        print(f"Error updating scores: {e}")
-    finally:
-        if conn:
-            conn.close()
+        raise
 
-def load_data_from_db():
-    """Loads all necessary data from the database into global pandas DataFrames."""
-    global trips_df, stops_df, routes_df, calendar_df, stop_times_df, trips_with_stops_df
+    counts["trips_resolved"] = len(resolved_trips)
+    return counts
 
-    db_user = os.environ.get("POSTGRES_USER")
-    db_password = os.environ.get("POSTGRES_PASSWORD")
-    db_host = os.environ.get("POSTGRES_HOST")
-    db_name = os.environ.get("POSTGRES_DB")
+def read_frame(conn, query: str, params=None) -> pd.DataFrame:
+    """Runs a query on a pooled connection and returns the result as a DataFrame."""
+    import pandas as pd
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        columns = [desc[0] for desc in cur.description]
+        frame = pd.DataFrame(cur.fetchall(), columns=columns)
+    conn.commit()
+    return frame
 
-    db_url = f'postgresql://{db_user}:{db_password}@{db_host}/{db_name}'
-    engine = create_engine(db_url)
+def to_json_records(df: pd.DataFrame) -> list:
+    """Converts a trips frame to JSON-serializable records."""
+    records = df.copy()
+    records['service_date'] = records['service_date'].astype(str)
+    # NaN is not valid JSON; emit missing values as null
+    records = records.astype(object).where(records.notna(), None)
+    return records.to_dict(orient='records')
 
-    try:
-        stops_df = pd.read_sql('SELECT * FROM stops', engine)
-        routes_df = pd.read_sql('SELECT * FROM routes', engine)
-        calendar_df = pd.read_sql('SELECT * FROM calendar', engine)
-        trips_df = pd.read_sql('SELECT * FROM trips', engine)
-        stop_times_df = pd.read_sql('SELECT * FROM stop_times', engine)
-
-        # Convert service_date to datetime objects
-        trips_df['service_date'] = pd.to_datetime(trips_df['service_date']).dt.date
-        stop_times_df['service_date'] = pd.to_datetime(stop_times_df['service_date']).dt.date
-
-        print("Successfully loaded data from the database.")
-        print(f"trips_df columns before filter: {trips_df.columns.tolist()}")
-        print(f"trips_df shape before filter: {trips_df.shape}")
-
-        # --- Filter trips for a relevant date range ---
-        today = datetime.now().date()
-        future_days = 0 # Load trips for today only
-        date_filter_start = today
-        date_filter_end = today + timedelta(days=future_days)
-
-        trips_df = trips_df[(trips_df['service_date'] >= date_filter_start) & (trips_df['service_date'] <= date_filter_end)]
-        valid_trip_ids_dates = trips_df[['trip_id', 'service_date']].drop_duplicates()
-        
-        stop_times_df = pd.merge(stop_times_df, valid_trip_ids_dates, on=['trip_id', 'service_date'], how='inner')
-        # --- End Filter trips ---
-
-        print(f"trips_df columns after filter: {trips_df.columns.tolist()}")
-        print(f"trips_df shape after filter: {trips_df.shape}")
-
-        # Pre-calculate the trips with stops dataframe
-        # Group by both trip_id and service_date
-        first_stops = stop_times_df.loc[stop_times_df.groupby(['trip_id', 'service_date'])['stop_sequence'].idxmin()]
-        last_stops = stop_times_df.loc[stop_times_df.groupby(['trip_id', 'service_date'])['stop_sequence'].idxmax()]
-
-        first_stops = pd.merge(first_stops, stops_df, on='stop_id', how='left')
-        last_stops = pd.merge(last_stops, stops_df, on='stop_id', how='left')
-
-        trips_with_stops = pd.merge(trips_df, first_stops[['trip_id', 'service_date', 'stop_name', 'arrival_time']], on=['trip_id', 'service_date'], how='left')
-        trips_with_stops.rename(columns={'stop_name': 'first_stop', 'arrival_time': 'first_stop_arrival_time'}, inplace=True)
-        
-        trips_with_stops_df = pd.merge(trips_with_stops, last_stops[['trip_id', 'service_date', 'stop_name', 'arrival_time']], on=['trip_id', 'service_date'], how='left')
-        trips_with_stops_df.rename(columns={'stop_name': 'last_stop', 'arrival_time': 'last_stop_arrival_time'}, inplace=True)
-
-        print("Successfully pre-calculated trips with stops.")
+def seconds_to_time(seconds: pd.Series) -> pd.Series:
+    """Vectorized seconds since service-day midnight -> HH:MM:SS, with hours past 24 kept (None if missing)."""
+    hours, rest = seconds // 3600, seconds % 3600
+    text = (
+        hours.astype('string').str.zfill(2) + ':'
+        + (rest // 60).astype('string').str.zfill(2) + ':'
+        + (rest % 60).astype('string').str.zfill(2)
+    )
+    return text.astype(object).where(seconds.notna(), None)
+
+def serialize_trips(trips_with_stops: pd.DataFrame) -> bytes:
+    """Sorts trips by first departure and serializes them once for GET /trips."""
+    trips_output = trips_with_stops.sort_values(by='first_stop_arrival_seconds', kind='stable', na_position='last')
+    body = json.dumps(to_json_records(trips_output), sort_keys=True, separators=(',', ':'), default=str)
+    return body.encode('utf-8')
+
+LAST_STOP_COLUMNS = ['trip_id', 'service_date', 'last_stop_sequence', 'last_stop_arrival_seconds']
+
+def build_resolution_queue(trips_with_stops: pd.DataFrame) -> list:
+    """Builds a heap of resolution deadlines for every unresolved trip."""
+    import pandas as pd
+    pending = trips_with_stops[trips_with_stops['outcome'].isnull()]
+    arrival_seconds = pending['last_stop_arrival_seconds']
 
+    missing = int(arrival_seconds.isna().sum())
+    if missing:
+        print(f"No last stop arrival time for {missing} trips. Skipping them for resolution.")
+    pending = pending[arrival_seconds.notna()]
+    arrival_seconds = arrival_seconds[arrival_seconds.notna()].astype('int64')
+
+    # GTFS times may exceed 24:00:00, so offset from service-day midnight
+    deadlines = (
+        pd.to_datetime(pending['service_date'])
+        + pd.to_timedelta(arrival_seconds, unit='s')
+        + RESOLUTION_DELAY
+    )
+    queue = list(zip(deadlines.dt.to_pydatetime(), pending['trip_id'], pending['service_date']))
+    heapq.heapify(queue)
+    return queue
+
+def sync_resolution_queue():
+    """
+    Rebuilds the resolution queue if it was built from an older timetable than the one being served.
+
+    Entries for trips outside the new timetable, such as yesterday's trips that run past midnight
+    or are still waiting for realtime data or a retry when the window rolls over, are carried over
+    with their last-stop details so they are still resolved.
+    """
+    global resolution_queue, resolution_queue_version, resolution_last_stops
+    import pandas as pd
+    timetable = _timetable
+    with resolution_queue_lock:
+        if timetable is None or resolution_queue_version == timetable.version:
+            return
+        trips_with_stops = timetable.frame('trips_with_stops')
+        queue = build_resolution_queue(trips_with_stops)
+        last_stops = trips_with_stops[LAST_STOP_COLUMNS]
+
+        in_timetable = set(zip(trips_with_stops['trip_id'], trips_with_stops['service_date']))
+        carried = [entry for entry in resolution_queue if (entry[1], entry[2]) not in in_timetable]
+        if carried:
+            queue.extend(carried)
+            heapq.heapify(queue)
+            carried_keys = pd.DataFrame([entry[1:] for entry in carried], columns=['trip_id', 'service_date']).drop_duplicates()
+            if resolution_last_stops is not None:
+                carried_stops = resolution_last_stops.merge(carried_keys, on=['trip_id', 'service_date'])
+                last_stops = pd.concat([last_stops, carried_stops], ignore_index=True)
+
+        resolution_queue = queue
+        resolution_queue_version = timetable.version
+        resolution_last_stops = last_stops
+    print(
+        f"Scheduled {len(resolution_queue)} unresolved trips for resolution from timetable version {timetable.version}"
+        f" ({len(carried)} carried over from the previous timetable)."
+    )
+
+def get_resolution_last_stops() -> pd.DataFrame:
+    """trip_id, service_date, last_stop_sequence and last_stop_arrival_seconds for every queued trip."""
+    sync_resolution_queue()
+    with resolution_queue_lock:
+        return resolution_last_stops
+
+def pop_due_trips(now: datetime = None) -> list:
+    """Removes and returns the (deadline, trip_id, service_date) entries that are due."""
+    now = now or datetime.now()
+    sync_resolution_queue()
+    due = []
+    with resolution_queue_lock:
+        while resolution_queue and resolution_queue[0][0] <= now:
+            due.append(heapq.heappop(resolution_queue))
+    return due
+
+def requeue_trips(entries: list):
+    """Puts entries back on the resolution queue, e.g. after a failed resolver run."""
+    with resolution_queue_lock:
+        for entry in entries:
+            heapq.heappush(resolution_queue, entry)
+    if entries:
+        resolution_queue_changed.set()
+
+def next_resolution_time():
+    """Returns the earliest queued deadline, or None if the queue is empty."""
+    sync_resolution_queue()
+    with resolution_queue_lock:
+        return resolution_queue[0][0] if resolution_queue else None
+
+def timetable_window(today=None) -> tuple:
+    """Returns the (first, last) service dates to keep in memory."""
+    today = today or datetime.now().date()
+    window_days = max(int(os.environ.get('TIMETABLE_WINDOW_DAYS', 1)), 1)
+    return today, today + timedelta(days=window_days - 1)
+
+def window_key(window: tuple) -> list:
+    """The window as stored in snapshot metadata."""
+    return [window[0].isoformat(), window[1].isoformat()]
+
+def snapshot_matches(metadata, window: tuple) -> bool:
+    """Whether published snapshot metadata is for this window and in the current format."""
+    return metadata is not None and metadata.get('format') == SNAPSHOT_FORMAT and metadata['window'] == window_key(window)
+
+def content_version(conn, window: tuple) -> dict:
+    """
+    A cheap fingerprint of the timetable data for a window, stored with each snapshot. It changes
+    when load_static_data.py loads different trips, stop times, stops, routes or calendars. Trip
+    outcomes set by the resolver are not part of it.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM trips WHERE service_date BETWEEN %(start)s AND %(end)s) AS trips,
+                (SELECT MAX(service_date)::text FROM trips) AS max_service_date,
+                (SELECT COUNT(*) FROM stop_times WHERE service_date BETWEEN %(start)s AND %(end)s) AS stop_times,
+                (SELECT COUNT(*) FROM stops) AS stops,
+                (SELECT COUNT(*) FROM routes) AS routes,
+                (SELECT COUNT(*) FROM calendar) AS calendar
+        """, {'start': window[0], 'end': window[1]})
+        columns = [desc[0] for desc in cur.description]
+        version = dict(zip(columns, cur.fetchone()))
+    conn.commit()
+    return version
+
+def build_snapshot(window: tuple, version: dict) -> str:
+    """
+    Reads the service-date window from the database, pre-calculates the trips with their first
+    and last stops, and publishes the result as a new snapshot. Call under build_lock().
+    """
+    import pandas as pd
+
+    # --- Filter trips for the relevant date range in SQL ---
+    with pooled_connection() as conn:
+        new_trips = read_frame(conn, 'SELECT * FROM trips WHERE service_date BETWEEN %s AND %s', window)
+        new_stop_times = read_frame(conn, 'SELECT * FROM stop_times WHERE service_date BETWEEN %s AND %s', window)
+        new_stops = read_frame(conn, """
+            SELECT * FROM stops
+            WHERE stop_id IN (SELECT DISTINCT stop_id FROM stop_times WHERE service_date BETWEEN %s AND %s)
+        """, window)
+        new_routes = read_frame(conn, 'SELECT * FROM routes')
+        new_calendar = read_frame(conn, 'SELECT * FROM calendar')
+
+    # Convert service_date to datetime objects
+    new_trips['service_date'] = pd.to_datetime(new_trips['service_date']).dt.date
+    new_stop_times['service_date'] = pd.to_datetime(new_stop_times['service_date']).dt.date
+    # Seconds since service-day midnight fit in int32 even for trips running past 24:00:00
+    new_stop_times = new_stop_times.astype({'arrival_seconds': 'Int32', 'departure_seconds': 'Int32'})
+
+    print(f"Successfully loaded data for {window[0]} to {window[1]} from the database.")
+    print(f"trips shape: {new_trips.shape}, stop_times shape: {new_stop_times.shape}")
+
+    # Pre-calculate the trips with stops dataframe
+    # Group by both trip_id and service_date
+    grouped = new_stop_times.groupby(['trip_id', 'service_date'])['stop_sequence']
+    first_stops = new_stop_times.loc[grouped.idxmin()]
+    last_stops = new_stop_times.loc[grouped.idxmax()]
+
+    first_stops = pd.merge(first_stops, new_stops, on='stop_id', how='left')
+    last_stops = pd.merge(last_stops, new_stops, on='stop_id', how='left')
+    last_stops = last_stops.rename(columns={'stop_sequence': 'last_stop_sequence'})
+
+    trips_with_stops = pd.merge(new_trips, first_stops[['trip_id', 'service_date', 'stop_name', 'arrival_seconds']], on=['trip_id', 'service_date'], how='left')
+    trips_with_stops.rename(columns={'stop_name': 'first_stop', 'arrival_seconds': 'first_stop_arrival_seconds'}, inplace=True)
+
+    new_trips_with_stops = pd.merge(trips_with_stops, last_stops[['trip_id', 'service_date', 'stop_name', 'arrival_seconds', 'last_stop_sequence']], on=['trip_id', 'service_date'], how='left')
+    new_trips_with_stops.rename(columns={'stop_name': 'last_stop', 'arrival_seconds': 'last_stop_arrival_seconds'}, inplace=True)
+    new_trips_with_stops = new_trips_with_stops.astype({
+        'first_stop_arrival_seconds': 'Int32',
+        'last_stop_arrival_seconds': 'Int32',
+        'last_stop_sequence': 'Int64',
+    })
+    # Clients still get HH:MM:SS strings alongside the seconds
+    new_trips_with_stops['first_stop_arrival_time'] = seconds_to_time(new_trips_with_stops['first_stop_arrival_seconds'])
+    new_trips_with_stops['last_stop_arrival_time'] = seconds_to_time(new_trips_with_stops['last_stop_arrival_seconds'])
+
+    print("Successfully pre-calculated trips with stops.")
+
+    body = serialize_trips(new_trips_with_stops)
+    return write_snapshot(
+        {
+            'trips': new_trips,
+            'stop_times': new_stop_times,
+            'stops': new_stops,
+            'routes': new_routes,
+            'calendar': new_calendar,
+            'trips_with_stops': new_trips_with_stops,
+        },
+        {'trips.json': body, 'trips.json.gz': gzip.compress(body, compresslevel=6)},
+        {'window': window_key(window), 'format': SNAPSHOT_FORMAT, 'content_version': version},
+    )
+
+def swap_timetable(snapshot) -> Timetable:
+    """Makes snapshot the timetable this process serves."""
+    global _timetable
+    # A single reference assignment, so requests see either the old timetable or the new one
+    _timetable = Timetable(snapshot)
+    # A sleeping resolver wakes up and rebuilds its queue from the new timetable
+    resolution_queue_changed.set()
+    return _timetable
+
+def load_data_from_db(force: bool = False):
+    """
+    Loads the rolling service-date window and makes it the timetable this process serves.
+
+    The published snapshot is reused while its window and content version match the database.
+    Otherwise the first process on the host to get here rebuilds it, and the others wait for it
+    and memory-map the same files rather than each reading the tables. Requests keep being
+    served from the previous timetable until the new one is complete, and a failed load leaves
+    the previous one in place.
+    """
+    window = timetable_window()
+
+    try:
+        with pooled_connection() as conn:
+            version = content_version(conn, window)
+        with build_lock():
+            current = read_current_metadata()
+            if (
+                not force
+                and snapshot_matches(current, window)
+                and current.get('content_version') == version
+            ):
+                print(f"Timetable snapshot version {current['version']} is up to date.")
+            else:
+                build_snapshot(window, version)
+            name = current_snapshot_name()
+            if _timetable is not None and _timetable.snapshot.name == name:
+                # Keep the trip index and resolution queue this process already built
+                return True
+            new_timetable = swap_timetable(open_current_snapshot())
     except Exception as e:
         print(f"Error loading data from database: {e}")
+        return False
+
+    payload = new_timetable.payload
+    print(f"Indexed {len(new_timetable.trip_index)} trips by (trip_id, service_date).")
+    print(f"Serving /trips payload version {payload.etag} ({len(payload.body)} bytes, {len(payload.gzip_body)} gzipped).")
+    return True
+
+def start_timetable() -> threading.Thread:
+    """
+    Starts serving the cached snapshot for the current window straight away, if there is one,
+    and checks it against the database in the background, rebuilding it if the data changed.
+    Returns the background loader thread.
+    """
+    current = read_current_metadata()
+    if snapshot_matches(current, timetable_window()):
+        try:
+            timetable = swap_timetable(open_current_snapshot())
+            print(f"Serving cached timetable snapshot version {timetable.version} while it is checked against the database.")
+        except Exception as e:
+            print(f"Could not open the cached timetable snapshot: {e}")
+    else:
+        print("No cached timetable snapshot for the current window; loading it in the background.")
+
+    loader = threading.Thread(target=load_data_from_db, name='timetable-loader', daemon=True)
+    loader.start()
+    return loader
+
+def timetable_loading_response():
+    response = jsonify({"error": "Timetable is loading, retry shortly"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
 
 @trips_bp.route('', methods=['GET'])
 def get_trips():
     """Returns a list of trips with their first and last stops."""
-    if trips_with_stops_df.empty:
-        return jsonify({"error": "Data not loaded"}), 500
+    timetable = get_timetable()
+    if timetable is None:
+        return timetable_loading_response()
+    payload = timetable.payload
 
-    # Convert arrival times to timedelta for sorting
-    trips_output = trips_with_stops_df.copy()
-    trips_output['first_stop_arrival_timedelta'] = trips_output['first_stop_arrival_time'].apply(lambda x: sum(int(i) * 60 ** idx for idx, i in enumerate(reversed(x.split(':')))) if pd.notna(x) else pd.NaT)
-    
-    # Sort by first_stop_arrival_timedelta
-    trips_output = trips_output.sort_values(by='first_stop_arrival_timedelta').drop(columns=['first_stop_arrival_timedelta'])
+    # Either representation of the current version is a valid cache hit
+    if request.if_none_match.contains(payload.etag) or request.if_none_match.contains(payload.gzip_etag):
+        response = Response(status=304)
+        response.set_etag(payload.gzip_etag if request.accept_encodings['gzip'] else payload.etag)
+    elif request.accept_encodings['gzip']:
+        response = Response(payload.stream(gzipped=True), mimetype='application/json')
+        response.content_length = len(payload.gzip_body)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(payload.gzip_etag)
+    else:
+        response = Response(payload.stream(gzipped=False), mimetype='application/json')
+        response.content_length = len(payload.body)
+        response.set_etag(payload.etag)
 
-    # Convert service_date to string for JSON serialization
-    trips_output['service_date'] = trips_output['service_date'].astype(str)
-    return jsonify(trips_output.to_dict(orient='records'))
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may cache but must revalidate, since the payload changes on every data load
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Data-Version'] = str(payload.version)
+    return response
 
 @trips_bp.route('/<string:trip_id>/<string:service_date>', methods=['GET'])
 def get_trip(trip_id: str, service_date: str):
     """Returns the details of a single trip."""
-    if trips_df.empty:
-        return jsonify({"error": "Data not loaded"}), 500
+    timetable = get_timetable()
+    if timetable is None:
+        return timetable_loading_response()
 
-    # Convert service_date string to date object for comparison
-    service_date_obj = datetime.strptime(service_date, '%Y-%m-%d').date()
+    # Normalize the date so keys match the index regardless of input formatting
+    try:
+        service_date_key = datetime.strptime(service_date, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return jsonify({"error": "Invalid service_date format. Use YYYY-MM-DD."}), 400
 
-    trip_details = trips_df[(trips_df['trip_id'] == trip_id) & (trips_df['service_date'] == service_date_obj)]
+    trip_details = timetable.trip_index.get((trip_id, service_date_key))
 
-    if trip_details.empty:
+    if trip_details is None:
         return jsonify({"error": "Trip not found"}), 404
 
-    # Convert service_date to string for JSON serialization
-    trip_output = trip_details.copy()
-    trip_output['service_date'] = trip_output['service_date'].astype(str)
-    return jsonify(trip_output.to_dict(orient='records')[0])
\ No newline at end of file
+    return jsonify(trip_details)
\ No newline at end of file
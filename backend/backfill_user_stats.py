@@ -0,0 +1,9 @@
+from app.db import pooled_connection
+from app.stats import rebuild_user_stats
+
+# Rebuilds user_stats and user_route_stats from the full prediction history.
+# Safe to run while the app is up: resolver updates wait until the rebuild commits.
+with pooled_connection() as conn:
+    counts = rebuild_user_stats(conn)
+
+print(f"Rebuilt stats for {counts['users']} users ({counts['user_routes']} user/route pairs) from {counts['predictions']} resolved predictions.")
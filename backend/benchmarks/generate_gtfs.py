@@ -0,0 +1,127 @@
+"""
+Writes a synthetic GTFS static feed that load_static_data.py can load.
+
+    python benchmarks/generate_gtfs.py --preset agency --out /tmp/gtfs-agency
+    python benchmarks/generate_gtfs.py --routes 10 --trips-per-route 50 --stops-per-trip 25 --days 2 --out /tmp/gtfs
+
+Every trip runs on every day from --start-date for --days days, so all of them fall
+inside the backend's timetable window when --days matches TIMETABLE_WINDOW_DAYS.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Scales matching the real feed: one weekday of route 37807, and the whole TransLink agency
+PRESETS = {
+    "route-37807": {"routes": 1, "trips_per_route": 258, "stops_per_trip": 30, "stops": 60, "days": 1},
+    "agency": {"routes": 238, "trips_per_route": 104, "stops_per_trip": 40, "stops": 8800, "days": 1},
+}
+
+FIRST_ROUTE_ID = 37807
+FIRST_TRIP_ID = 20000000
+SERVICE_ID = "BENCH"
+SECONDS_BETWEEN_STOPS = 90
+
+
+def format_times(seconds: np.ndarray) -> pd.Series:
+    """Seconds since service-day midnight -> HH:MM:SS, allowing hours past 24."""
+    seconds = pd.Series(seconds)
+    return (
+        (seconds // 3600).astype(str).str.zfill(2) + ":"
+        + (seconds % 3600 // 60).astype(str).str.zfill(2) + ":"
+        + (seconds % 60).astype(str).str.zfill(2)
+    )
+
+
+def generate(routes: int, trips_per_route: int, stops_per_trip: int, stops: int, days: int, start_date: date, seed: int = 42) -> dict:
+    """Returns GTFS tables as DataFrames keyed by file name."""
+    rng = np.random.default_rng(seed)
+    stops = max(stops, stops_per_trip)
+
+    route_ids = np.arange(FIRST_ROUTE_ID, FIRST_ROUTE_ID + routes).astype(str)
+    routes_df = pd.DataFrame({
+        "route_id": route_ids,
+        "route_short_name": [f"{i:03d}" for i in range(1, routes + 1)],
+        "route_long_name": [f"Synthetic Route {i}" for i in range(1, routes + 1)],
+    })
+
+    stops_df = pd.DataFrame({
+        "stop_id": np.arange(1, stops + 1).astype(str),
+        "stop_name": [f"Synthetic Stop {i}" for i in range(1, stops + 1)],
+        "stop_lat": rng.uniform(49.0, 49.4, stops).round(6),
+        "stop_lon": rng.uniform(-123.3, -122.6, stops).round(6),
+    })
+
+    end_date = start_date + timedelta(days=days - 1)
+    calendar_df = pd.DataFrame([{
+        "service_id": SERVICE_ID,
+        "monday": 1, "tuesday": 1, "wednesday": 1, "thursday": 1, "friday": 1, "saturday": 1, "sunday": 1,
+        "start_date": start_date.strftime("%Y%m%d"),
+        "end_date": end_date.strftime("%Y%m%d"),
+    }])
+
+    trip_count = routes * trips_per_route
+    trip_route = np.repeat(np.arange(routes), trips_per_route)
+    direction = np.tile(np.arange(trips_per_route) % 2, routes)
+    trips_df = pd.DataFrame({
+        "route_id": route_ids[trip_route],
+        "service_id": SERVICE_ID,
+        "trip_id": np.arange(FIRST_TRIP_ID, FIRST_TRIP_ID + trip_count).astype(str),
+        "trip_headsign": pd.Series(route_ids[trip_route]) + np.where(direction == 0, " Outbound", " Inbound"),
+        "direction_id": direction,
+        "shape_id": route_ids[trip_route],
+    })
+
+    # Each route serves a fixed run of stops; departures are spread from 05:00 to 25:00
+    route_first_stop = rng.integers(0, stops - stops_per_trip + 1, routes)
+    first_departure = rng.integers(5 * 3600, 25 * 3600, trip_count)
+    sequence = np.tile(np.arange(1, stops_per_trip + 1), trip_count)
+    trip_row = np.repeat(np.arange(trip_count), stops_per_trip)
+    arrival = first_departure[trip_row] + (sequence - 1) * SECONDS_BETWEEN_STOPS
+    stop_index = route_first_stop[trip_route[trip_row]] + sequence - 1
+    times = format_times(arrival)
+    stop_times_df = pd.DataFrame({
+        "trip_id": trips_df["trip_id"].to_numpy()[trip_row],
+        "arrival_time": times,
+        "departure_time": times,
+        "stop_id": stops_df["stop_id"].to_numpy()[stop_index],
+        "stop_sequence": sequence,
+    })
+
+    return {
+        "routes.txt": routes_df,
+        "stops.txt": stops_df,
+        "calendar.txt": calendar_df,
+        "trips.txt": trips_df,
+        "stop_times.txt": stop_times_df,
+    }
+
+
+def write_feed(tables: dict, out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, df in tables.items():
+        df.to_csv(os.path.join(out_dir, name), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic GTFS static feed.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="route-37807")
+    parser.add_argument("--routes", type=int)
+    parser.add_argument("--trips-per-route", type=int)
+    parser.add_argument("--stops-per-trip", type=int)
+    parser.add_argument("--stops", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--start-date", default=date.today().isoformat(), help="First service date (YYYY-MM-DD)")
+    parser.add_argument("--out", required=True, help="Directory to write the .txt files to")
+    args = parser.parse_args()
+
+    scale = dict(PRESETS[args.preset])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    tables = generate(start_date=date.fromisoformat(args.start_date), **scale)
+    write_feed(tables, args.out)
+    print(f"Wrote {len(tables['trips.txt'])} trips and {len(tables['stop_times.txt'])} stop times to {args.out}")
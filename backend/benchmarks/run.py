@@ -0,0 +1,323 @@
+"""
+Times the backend hot paths against a local Postgres loaded with a synthetic GTFS feed.
+
+    POSTGRES_HOST=localhost POSTGRES_USER=user POSTGRES_PASSWORD=password \
+        python benchmarks/run.py --database appdb_bench --preset route-37807
+    ... --preset agency
+
+The database is truncated and reloaded, so use a dedicated one initialised from
+database/init.sql. Each run appends a record to benchmarks/results.jsonl and prints the
+change against the previous record for the same scenario.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from generate_gtfs import PRESETS, generate, write_feed  # noqa: E402
+
+RESULTS_FILE = os.path.join(BACKEND_DIR, 'benchmarks', 'results.jsonl')
+
+RESET_TABLES = [
+    'email_outbox', 'user_route_stats', 'user_stats', 'predictions', 'friends', 'friend_requests', 'users',
+    'stop_times', 'trips', 'stops', 'routes', 'calendar',
+]
+
+
+def summarize(durations: list, peak_bytes: int = None, **extra) -> dict:
+    """Latency percentiles (ms) and throughput for a list of durations in seconds."""
+    ordered = sorted(durations)
+    stats = {
+        "count": len(ordered),
+        "ops_per_second": len(ordered) / sum(ordered) if sum(ordered) else None,
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000,
+        "p99_ms": ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+    if peak_bytes is not None:
+        stats["peak_memory_mb"] = peak_bytes / 2 ** 20
+    stats.update(extra)
+    return stats
+
+
+def timed(fn, repeat: int, setup=None) -> list:
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - started)
+    return durations
+
+
+def peak_memory(fn, setup=None) -> int:
+    """Peak traced allocation of one extra call, kept out of the timed runs since tracing slows them."""
+    if setup:
+        setup()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def reset_database():
+    from app.db import pooled_connection
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f'TRUNCATE {", ".join(RESET_TABLES)} RESTART IDENTITY CASCADE')
+        conn.commit()
+
+
+def load_feed(static_dir: str) -> float:
+    """Loads the feed with the production loader and returns its wall time."""
+    env = dict(os.environ, GTFS_STATIC_DIR=static_dir, GTFS_ROUTE_IDS='all')
+    started = time.perf_counter()
+    subprocess.run([sys.executable, 'load_static_data.py'], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def seed_predictions(trip_keys: list, users: int, predictions_per_user: int, seed: int = 42) -> int:
+    """Creates users that each predicted a random subset of trips; returns the prediction count."""
+    from app.db import pooled_connection
+    from app.stats import _copy_frame
+
+    rng = np.random.default_rng(seed)
+    user_frame = pd.DataFrame({
+        'nickname': [f'bench_{i}' for i in range(users)],
+        'email': [f'bench_{i}@example.com' for i in range(users)],
+        'password_hash': 'x',
+    })
+    per_user = min(predictions_per_user, len(trip_keys))
+    keys = np.array(trip_keys, dtype=object)
+    picks = np.concatenate([rng.choice(len(keys), per_user, replace=False) for _ in range(users)])
+    predictions = pd.DataFrame({
+        'user_id': np.repeat(np.arange(1, users + 1), per_user),
+        'trip_id': keys[picks, 0],
+        'service_date': keys[picks, 1],
+        'predicted_outcome': rng.choice(['on_time', 'late', 'early'], len(picks)),
+    })
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            _copy_frame(cur, 'users', user_frame)
+            _copy_frame(cur, 'predictions', predictions)
+            cur.execute('ANALYZE users; ANALYZE predictions')
+        conn.commit()
+    return len(predictions)
+
+
+def run_benchmarks(args, scale: dict) -> dict:
+    # Imported after the environment is configured, since modules read it at import time
+    from flask import Flask
+    from app import trips
+    from app.db import init_db, pooled_connection
+    from app.resolver import resolve_pending_trips
+
+    app = Flask('benchmarks')
+    init_db(app)
+    app.register_blueprint(trips.trips_bp)
+    client = app.test_client()
+    results = {}
+
+    print("Generating and loading the synthetic feed...")
+    reset_database()
+    with tempfile.TemporaryDirectory() as static_dir:
+        tables = generate(start_date=date.today(), seed=args.seed, **scale)
+        write_feed(tables, static_dir)
+        results['load_static_data'] = summarize([load_feed(static_dir)], stop_times=len(tables['stop_times.txt']) * scale['days'])
+
+    print("Timing load_data_from_db...")
+
+    def rebuild():
+        trips.load_data_from_db(force=True)
+
+    results['load_data_from_db'] = summarize(
+        timed(rebuild, args.repeat),
+        peak_memory(rebuild),
+        trips=len(trips.get_timetable().trip_index),
+    )
+
+    print("Timing load_data_from_db against an up-to-date snapshot...")
+    results['load_data_from_snapshot'] = summarize(
+        timed(trips.load_data_from_db, args.repeat),
+        peak_memory(trips.load_data_from_db),
+    )
+
+    print("Timing a warm start from the cached snapshot...")
+    loaders = []
+    results['warm_start'] = summarize(timed(lambda: loaders.append(trips.start_timetable()), args.repeat))
+    for loader in loaders:
+        loader.join()
+
+    print("Timing GET /trips...")
+    etag = trips.get_timetable().payload.etag
+    for name, headers in (('get_trips', {}), ('get_trips_gzip', {'Accept-Encoding': 'gzip'}), ('get_trips_304', {'If-None-Match': f'"{etag}"'})):
+        results[name] = summarize(timed(lambda: client.get('/trips', headers=headers), args.requests))
+
+    print("Timing GET /trips/<trip_id>/<service_date>...")
+    trip_keys = list(trips.get_timetable().trip_index)
+    sample = [random.choice(trip_keys) for _ in range(args.requests)]
+    urls = iter(f'/trips/{trip_id}/{service_date}' for trip_id, service_date in sample)
+    results['get_trip'] = summarize(timed(lambda: client.get(next(urls)), args.requests))
+
+    print(f"Seeding {args.users} users with {args.predictions_per_user} predictions each...")
+    predictions = seed_predictions(trip_keys, args.users, args.predictions_per_user, args.seed)
+    resolve_count = min(args.resolve_trips, len(trip_keys))
+
+    def resolutions():
+        return [(trip_id, service_date, random.choice(['on_time', 'late', 'early']))
+                for trip_id, service_date in random.sample(trip_keys, resolve_count)]
+
+    print("Timing update_scores...")
+    with pooled_connection() as conn:
+        def score_and_roll_back():
+            with conn.cursor() as cur:
+                trips.update_scores(cur, resolutions())
+            conn.rollback()
+        results['update_scores'] = summarize(
+            timed(score_and_roll_back, args.repeat),
+            peak_memory(score_and_roll_back),
+            resolved_trips=resolve_count, predictions=predictions,
+        )
+
+    print("Timing resolve_pending_trips...")
+
+    def queue_due_trips():
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('UPDATE trips SET outcome = NULL WHERE outcome IS NOT NULL')
+                cur.execute('UPDATE users SET cumulative_score = 0')
+                cur.execute('TRUNCATE user_stats, user_route_stats, email_outbox')
+            conn.commit()
+        deadline = datetime.now() - timedelta(minutes=1)
+        trips.sync_resolution_queue()
+        with trips.resolution_queue_lock:
+            del trips.resolution_queue[:]
+        trips.requeue_trips([(deadline, trip_id, service_date) for trip_id, service_date, _ in resolutions()])
+
+    results['resolve_pending_trips'] = summarize(
+        timed(lambda: resolve_pending_trips(app), args.repeat, setup=queue_due_trips),
+        peak_memory(lambda: resolve_pending_trips(app), setup=queue_due_trips),
+        resolved_trips=resolve_count, predictions=predictions,
+    )
+    return results
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_record(results_file: str, scenario: str, scale: dict):
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['scenario'] == scenario and record['scale'] == scale:
+                previous = record
+    return previous
+
+
+def print_results(record: dict, previous: dict):
+    print(f"\n{record['scenario']} @ {record['git_revision']}" + (f" vs {previous['git_revision']}" if previous else ''))
+    print(f"{'benchmark':<24}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'ops/s':>11}{'peak MiB':>10}{'p50 change':>12}")
+    for name, stats in record['results'].items():
+        change = ''
+        before = previous and previous['results'].get(name)
+        if before and before['p50_ms']:
+            change = f"{(stats['p50_ms'] / before['p50_ms'] - 1) * 100:+.1f}%"
+        peak = f"{stats['peak_memory_mb']:.1f}" if 'peak_memory_mb' in stats else ''
+        print(f"{name:<24}{stats['count']:>7}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}"
+              f"{stats['ops_per_second'] or 0:>11.1f}{peak:>10}{change:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths on a synthetic GTFS feed.")
+    parser.add_argument('--database', required=True, help="Dedicated benchmark database; it is truncated")
+    parser.add_argument('--force', action='store_true', help="Allow a database name without 'bench' in it")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='route-37807')
+    parser.add_argument('--routes', type=int)
+    parser.add_argument('--trips-per-route', type=int)
+    parser.add_argument('--stops-per-trip', type=int)
+    parser.add_argument('--stops', type=int)
+    parser.add_argument('--days', type=int)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each batch benchmark")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint benchmark")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--predictions-per-user', type=int, default=20)
+    parser.add_argument('--resolve-trips', type=int, default=500, help="Trips resolved per scoring run")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    if 'bench' not in args.database and not args.force:
+        parser.error("refusing to truncate a database without 'bench' in its name (use --force)")
+
+    scale = dict(PRESETS[args.preset])
+    custom = False
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+            custom = True
+    scenario = f"{args.preset}-custom" if custom else args.preset
+
+    os.environ['POSTGRES_DB'] = args.database
+    os.environ['TIMETABLE_WINDOW_DAYS'] = str(scale['days'])
+    # Snapshots go to a directory the app does not use
+    os.environ['TIMETABLE_SNAPSHOT_DIR'] = tempfile.mkdtemp(prefix='timetable-bench-')
+    # Outcomes are simulated so the resolver does not depend on a live feed
+    os.environ.pop('GTFS_RT_URL', None)
+    os.environ.pop('GTFS_RT_FILE', None)
+    random.seed(args.seed)
+
+    results = run_benchmarks(args, scale)
+    record = {
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "git_revision": git_revision(),
+        "scenario": scenario,
+        "scale": scale,
+        "settings": {key: getattr(args, key) for key in ('repeat', 'requests', 'users', 'predictions_per_user', 'resolve_trips', 'seed')},
+        "python": platform.python_version(),
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+
+    previous = previous_record(args.results, scenario, scale)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    print_results(record, previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 #!/bin/sh
 
 
+# Bring the schema up to date before anything reads or loads data
+python /app/migrate.py || exit 1
+
 python /app/load_static_data.py
 
 echo "Starting Flask application..."
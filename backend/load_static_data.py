@@ -1,7 +1,9 @@
-import pandas as pd
-from sqlalchemy import create_engine, text
+import io
 import os
-from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import psycopg2
 
 # Database connection settings from docker-compose
 db_user = os.environ.get("POSTGRES_USER")
@@ -9,35 +11,116 @@ db_password = os.environ.get("POSTGRES_PASSWORD")
 db_host = os.environ.get("POSTGRES_HOST")
 db_name = os.environ.get("POSTGRES_DB")
 
-# SQLAlchemy connection string
-db_url = f'postgresql://{db_user}:{db_password}@{db_host}/{db_name}'
-engine = create_engine(db_url)
-
 # Path to static data files
-static_data_path = './static_data/'
+static_data_path = os.path.join(os.environ.get('GTFS_STATIC_DIR', './static_data'), '')
+
+# Comma-separated route_ids to load, or "all" for the full agency feed
+route_filter = os.environ.get('GTFS_ROUTE_IDS', '37807')
+
+# stop_times rows read, expanded and copied per chunk; bounds peak memory
+chunk_rows = int(os.environ.get('GTFS_LOAD_CHUNK_ROWS', 250000))
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+STOP_TIMES_COLUMNS = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']
+
+
+def read_stop_times(**kwargs):
+    return pd.read_csv(
+        static_data_path + 'stop_times.txt',
+        dtype={'trip_id': str, 'stop_id': str},
+        chunksize=chunk_rows,
+        **kwargs
+    )
+
+
+def time_to_seconds(times):
+    """HH:MM:SS -> Int32 seconds since service-day midnight; GTFS hours may exceed 24. Missing stays NA."""
+    parts = times.astype('string').str.strip().str.split(':', expand=True)
+    if parts.shape[1] < 3:
+        return pd.Series(pd.NA, index=times.index, dtype='Int32')
+    parts = parts.iloc[:, :3].apply(pd.to_numeric, errors='coerce')
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).round().astype('Int32')
+
+
+def expand_service_dates(calendar):
+    """Returns one (service_id, service_date) row per day each service runs."""
+    calendar = calendar.reset_index(drop=True)
+    start = pd.to_datetime(calendar['start_date'].astype(str), format='%Y%m%d')
+    end = pd.to_datetime(calendar['end_date'].astype(str), format='%Y%m%d')
+    if calendar.empty:
+        return pd.DataFrame(columns=['service_id', 'service_date'])
+
+    # Cross join every service with every date in the feed's range
+    dates = pd.DataFrame({'service_date': pd.date_range(start.min(), end.max(), freq='D')})
+    services = pd.DataFrame({'calendar_row': calendar.index, 'start': start, 'end': end})
+    expanded = services.merge(dates, how='cross')
+    expanded = expanded[(expanded['service_date'] >= expanded['start']) & (expanded['service_date'] <= expanded['end'])]
+
+    # Keep only the dates whose weekday flag is set for that service (Monday is 0, Sunday is 6)
+    day_flags = calendar[WEEKDAYS].to_numpy() == 1
+    runs = day_flags[expanded['calendar_row'].to_numpy(), expanded['service_date'].dt.weekday.to_numpy()]
+    expanded = expanded[runs]
+
+    return pd.DataFrame({
+        'service_id': calendar['service_id'].to_numpy()[expanded['calendar_row'].to_numpy()],
+        'service_date': expanded['service_date'].dt.strftime('%Y-%m-%d').to_numpy(),
+    })
+
+
+def expand_stop_times(chunk):
+    """
+    Yields the chunk's rows repeated once per service date of their trip, in slices of about
+    chunk_rows rows. A trip can run on hundreds of dates, so expanding a whole chunk at once
+    would multiply its size by that.
+    """
+    counts = chunk['trip_id'].map(dates_per_trip).fillna(0).astype('int64').to_numpy()
+    starts = chunk['trip_id'].map(first_date_position).fillna(0).astype('int64').to_numpy()
+
+    # Each row goes to the slice its last expanded row falls in; a slice ends where that changes
+    slice_ids = (np.cumsum(counts) - 1) // chunk_rows
+    for rows in np.split(np.arange(len(chunk)), np.flatnonzero(np.diff(slice_ids)) + 1):
+        row_counts = counts[rows]
+        total = int(row_counts.sum())
+        if total == 0:
+            continue
+        # Position of each expanded row in trip_service_dates: its trip's first date plus an offset
+        offsets = np.arange(total) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+        positions = np.repeat(starts[rows], row_counts) + offsets
+        expanded = chunk.iloc[np.repeat(rows, row_counts)].reset_index(drop=True)
+        expanded['service_date'] = trip_service_dates[positions]
+        yield expanded
+
+
+def copy_frame(cur, table, df):
+    """Streams a DataFrame into a table with COPY; empty fields load as NULL."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(f'COPY {table} ({", ".join(df.columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
 
 # Load data into pandas DataFrames
 stops_df = pd.read_csv(static_data_path + 'stops.txt', dtype={'stop_id': str})
 routes_df = pd.read_csv(static_data_path + 'routes.txt', dtype={'route_id': str})
 calendar_df = pd.read_csv(static_data_path + 'calendar.txt', dtype={'service_id': str})
 trips_df = pd.read_csv(static_data_path + 'trips.txt', dtype={'trip_id': str, 'route_id': str, 'service_id': str, 'shape_id': str})
-stop_times_df = pd.read_csv(static_data_path + 'stop_times.txt', dtype={'trip_id': str, 'stop_id': str})
 
 # --- Data Pruning ---
-route_id_to_keep = '37807'
-
-routes_df = routes_df[routes_df['route_id'] == route_id_to_keep]
+if route_filter.strip().lower() != 'all':
+    route_ids_to_keep = [route_id.strip() for route_id in route_filter.split(',') if route_id.strip()]
 
-trips_df = trips_df[trips_df['route_id'] == route_id_to_keep]
+    routes_df = routes_df[routes_df['route_id'].isin(route_ids_to_keep)]
 
-valid_trip_ids = trips_df['trip_id'].unique()
-stop_times_df = stop_times_df[stop_times_df['trip_id'].isin(valid_trip_ids)]
+    trips_df = trips_df[trips_df['route_id'].isin(route_ids_to_keep)]
 
-valid_stop_ids = stop_times_df['stop_id'].unique()
-stops_df = stops_df[stops_df['stop_id'].isin(valid_stop_ids)]
+    valid_trip_ids = set(trips_df['trip_id'])
+    valid_stop_ids = set()
+    for chunk in read_stop_times(usecols=['trip_id', 'stop_id']):
+        valid_stop_ids.update(chunk.loc[chunk['trip_id'].isin(valid_trip_ids), 'stop_id'])
+    stops_df = stops_df[stops_df['stop_id'].isin(valid_stop_ids)]
 
-valid_service_ids = trips_df['service_id'].unique()
-calendar_df = calendar_df[calendar_df['service_id'].isin(valid_service_ids)]
+    valid_service_ids = trips_df['service_id'].unique()
+    calendar_df = calendar_df[calendar_df['service_id'].isin(valid_service_ids)]
 # --- End Data Pruning ---
 
 # Select and rename columns to match the database schema
@@ -45,54 +128,50 @@ stops_df = stops_df[['stop_id', 'stop_name', 'stop_lat', 'stop_lon']]
 routes_df = routes_df[['route_id', 'route_short_name', 'route_long_name']]
 calendar_df = calendar_df[['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'start_date', 'end_date']]
 trips_df = trips_df[['trip_id', 'route_id', 'service_id', 'trip_headsign', 'direction_id', 'shape_id']]
-stop_times_df = stop_times_df[['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']]
-
-# --- Expand trips and stop_times with service_date ---
-expanded_trips_data = []
-for idx, trip_row in trips_df.iterrows():
-    service_id = trip_row['service_id']
-    calendar_entry = calendar_df[calendar_df['service_id'] == service_id].iloc[0]
-
-    start_date = datetime.strptime(str(calendar_entry['start_date']), '%Y%m%d').date()
-    end_date = datetime.strptime(str(calendar_entry['end_date']), '%Y%m%d').date()
-
-    current_date = start_date
-    while current_date <= end_date:
-        day_of_week = current_date.weekday() # Monday is 0, Sunday is 6
-        
-        service_runs_today = False
-        if day_of_week == 0 and calendar_entry['monday'] == 1: service_runs_today = True
-        if day_of_week == 1 and calendar_entry['tuesday'] == 1: service_runs_today = True
-        if day_of_week == 2 and calendar_entry['wednesday'] == 1: service_runs_today = True
-        if day_of_week == 3 and calendar_entry['thursday'] == 1: service_runs_today = True
-        if day_of_week == 4 and calendar_entry['friday'] == 1: service_runs_today = True
-        if day_of_week == 5 and calendar_entry['saturday'] == 1: service_runs_today = True
-        if day_of_week == 6 and calendar_entry['sunday'] == 1: service_runs_today = True
-
-        if service_runs_today:
-            new_trip_row = trip_row.copy()
-            new_trip_row['service_date'] = current_date
-            expanded_trips_data.append(new_trip_row)
-        
-        current_date += timedelta(days=1)
-
-trips_df_expanded = pd.DataFrame(expanded_trips_data)
-
-# Merge stop_times with expanded trips to get service_date for each stop_time
-stop_times_df_expanded = pd.merge(stop_times_df, trips_df_expanded[['trip_id', 'service_date']], on='trip_id', how='inner')
-
-# --- End Expand trips and stop_times with service_date ---
-
-# Write DataFrames to the database
-print(f"Loading {len(stops_df)} stops...")
-stops_df.to_sql('stops', engine, if_exists='append', index=False)
-print(f"Loading {len(routes_df)} routes...")
-routes_df.to_sql('routes', engine, if_exists='append', index=False)
-print(f"Loading {len(calendar_df)} calendar entries...")
-calendar_df.to_sql('calendar', engine, if_exists='append', index=False)
-print(f"Loading {len(trips_df_expanded)} expanded trips...")
-trips_df_expanded.to_sql('trips', engine, if_exists='append', index=False)
-print(f"Loading {len(stop_times_df_expanded)} expanded stop times...")
-stop_times_df_expanded.to_sql('stop_times', engine, if_exists='append', index=False)
-
-print("Data loaded successfully into the database.")
\ No newline at end of file
+trips_df = trips_df.astype({'direction_id': 'Int64'})
+
+# --- Expand trips with service_date (calendar x date range, weekday mask) ---
+service_dates_df = expand_service_dates(calendar_df)
+trips_df_expanded = trips_df.merge(service_dates_df, on='service_id', how='inner')
+# Each trip's service dates as one contiguous run, so stop_times rows can be expanded by position
+trip_dates_df = trips_df_expanded[['trip_id', 'service_date']].sort_values('trip_id', kind='stable')
+trip_service_dates = trip_dates_df['service_date'].to_numpy()
+dates_per_trip = trip_dates_df.groupby('trip_id', sort=False).size()
+first_date_position = dates_per_trip.cumsum() - dates_per_trip
+# --- End Expand trips with service_date ---
+
+# Write DataFrames to the database in a single transaction
+conn = psycopg2.connect(host=db_host, database=db_name, user=db_user, password=db_password)
+try:
+    with conn.cursor() as cur:
+        print(f"Loading {len(stops_df)} stops...")
+        copy_frame(cur, 'stops', stops_df)
+        print(f"Loading {len(routes_df)} routes...")
+        copy_frame(cur, 'routes', routes_df)
+        print(f"Loading {len(calendar_df)} calendar entries...")
+        copy_frame(cur, 'calendar', calendar_df)
+        print(f"Loading {len(trips_df_expanded)} expanded trips...")
+        copy_frame(cur, 'trips', trips_df_expanded)
+
+        # Expand stop_times chunk by chunk so the full feed is never held in memory
+        stop_times_loaded = 0
+        for chunk in read_stop_times(usecols=STOP_TIMES_COLUMNS):
+            chunk = pd.DataFrame({
+                'trip_id': chunk['trip_id'],
+                'arrival_seconds': time_to_seconds(chunk['arrival_time']),
+                'departure_seconds': time_to_seconds(chunk['departure_time']),
+                'stop_id': chunk['stop_id'],
+                'stop_sequence': chunk['stop_sequence'],
+            })
+            for chunk_expanded in expand_stop_times(chunk):
+                copy_frame(cur, 'stop_times', chunk_expanded)
+                stop_times_loaded += len(chunk_expanded)
+            print(f"Loaded {stop_times_loaded} expanded stop times...")
+    conn.commit()
+except Exception:
+    conn.rollback()
+    raise
+finally:
+    conn.close()
+
+print("Data loaded successfully into the database.")
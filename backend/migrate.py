@@ -0,0 +1,112 @@
+"""
+Applies pending SQL migrations from database/migrations/ in filename order.
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending migrations
+
+Each file runs in its own transaction and is recorded in schema_migrations, so a failed
+migration leaves nothing half-applied and is retried on the next run. A session-level
+advisory lock makes runs that start at the same time (several containers booting at once)
+wait for each other instead of applying a file twice. Migrations are written to be safe on
+a database created from the current init.sql, where they only get recorded.
+"""
+import argparse
+import os
+
+import psycopg2
+
+# Database connection settings from docker-compose
+db_user = os.environ.get("POSTGRES_USER")
+db_password = os.environ.get("POSTGRES_PASSWORD")
+db_host = os.environ.get("POSTGRES_HOST")
+db_name = os.environ.get("POSTGRES_DB")
+
+MIGRATIONS_DIR = os.environ.get(
+    'MIGRATIONS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'migrations'),
+)
+
+# Held for the whole run; distinct from the resolver's leader lock
+MIGRATION_LOCK_KEY = 0x6D696772
+
+
+def migration_files(migrations_dir: str = MIGRATIONS_DIR) -> list:
+    """(version, path) for every .sql file, in the order they apply. The version is the file name without .sql."""
+    if not os.path.isdir(migrations_dir):
+        raise FileNotFoundError(f"Migrations directory not found: {migrations_dir} (set MIGRATIONS_DIR)")
+    return [
+        (name[:-len('.sql')], os.path.join(migrations_dir, name))
+        for name in sorted(os.listdir(migrations_dir))
+        if name.endswith('.sql')
+    ]
+
+
+def applied_versions(cur) -> set:
+    cur.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, migrations_dir: str = MIGRATIONS_DIR) -> list:
+    """Applies every migration not yet recorded; returns the versions applied."""
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+    conn.commit()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version VARCHAR(255) PRIMARY KEY,
+                    applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            applied = applied_versions(cur)
+        conn.commit()
+
+        newly_applied = []
+        for version, path in migration_files(migrations_dir):
+            if version in applied:
+                continue
+            with open(path) as f:
+                sql = f.read()
+            print(f"Applying migration {version}...")
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"Migration {version} failed; it was rolled back.")
+                raise
+            newly_applied.append(version)
+        return newly_applied
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+
+def print_status(conn, migrations_dir: str = MIGRATIONS_DIR):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        applied = applied_versions(cur) if cur.fetchone()[0] else set()
+    conn.commit()
+    for version, _ in migration_files(migrations_dir):
+        print(f"{'applied' if version in applied else 'pending'}  {version}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply pending database migrations.")
+    parser.add_argument('--status', action='store_true', help="List migrations without applying them")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=db_host, database=db_name, user=db_user, password=db_password)
+    try:
+        if args.status:
+            print_status(conn)
+        else:
+            versions = migrate(conn)
+            print(f"Applied {len(versions)} migrations." if versions else "Database schema is up to date.")
+    finally:
+        conn.close()
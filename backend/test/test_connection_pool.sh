@@ -0,0 +1,151 @@
+#!/bin/bash
+
+# Checks that the database connection pool reuses connections under concurrent checkouts
+# instead of opening a new one per request. psycopg2.connect is replaced with a stand-in,
+# so no database is needed; run it from the backend environment.
+
+# Exit immediately if a command exits with a non-zero status.
+set -e
+
+cd "$(dirname "$0")/.."
+
+# --- Helper Functions ---
+check_deps() {
+  echo "--- Checking for dependencies (python, psycopg2) ---"
+  if ! python -c "import psycopg2, flask" &> /dev/null; then
+    echo "The backend requirements could not be imported. Run this from the backend environment."
+    exit 1
+  fi
+  echo "--- Dependencies found ---"
+}
+
+# --- Main Script ---
+check_deps
+
+echo "--- Starting Connection Pool Test ---"
+
+python - <<'PY'
+import sys
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from app import db
+
+connects = []
+
+
+class FakeInfo:
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    info = FakeInfo()
+
+    def __init__(self):
+        self.closed = 0
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def fake_connect(**kwargs):
+    conn = FakeConnection()
+    connects.append(conn)
+    return conn
+
+
+db.psycopg2.connect = fake_connect
+
+
+def run_rounds(pool, rounds, concurrency):
+    """Checks out `concurrency` connections at once, holds them all, returns them; `rounds` times."""
+    seen = set()
+    for _ in range(rounds):
+        barrier = threading.Barrier(concurrency)
+
+        def worker():
+            conn = pool.getconn()
+            seen.add(id(conn))
+            # Everyone holds a connection at the same time before any is returned
+            barrier.wait()
+            pool.putconn(conn)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return seen
+
+
+def check(description, ok):
+    print(f"   - {'SUCCESS' if ok else 'FAILURE'}: {description}")
+    if not ok:
+        sys.exit(1)
+
+
+# 1. 20 checkouts in rounds of 4 open 4 connections, all kept for reuse
+print("1. Checking out 4 connections at once, 5 times, with POSTGRES_POOL_MIN=1...")
+pool = db.ConnectionPool(minconn=1, maxconn=10, timeout=5, health_check_interval=30)
+seen = run_rounds(pool, rounds=5, concurrency=4)
+stats = pool.stats()
+print(f"   - connections opened: {len(connects)}, distinct connections used: {len(seen)}, stats: {stats}")
+check("only 4 connections were opened for 20 checkouts", len(connects) == 4)
+check("all 4 stayed open and idle between rounds", stats["open"] == 4 and stats["idle"] == 4)
+check("no connection was discarded", stats["discarded"] == 0)
+
+# 2. More concurrent callers than maxconn wait for a connection instead of opening more
+print("2. Checking out with 8 callers and POSTGRES_POOL_MAX=4...")
+connects.clear()
+pool = db.ConnectionPool(minconn=1, maxconn=4, timeout=5, health_check_interval=30)
+results = []
+
+
+def hold_and_return():
+    conn = pool.getconn()
+    results.append(conn)
+    threading.Event().wait(0.05)
+    pool.putconn(conn)
+
+
+threads = [threading.Thread(target=hold_and_return) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+stats = pool.stats()
+print(f"   - connections opened: {len(connects)}, stats: {stats}")
+check("all 8 callers got a connection", len(results) == 8)
+check("never more than 4 connections were opened", len(connects) <= 4 and stats["open"] <= 4)
+check("callers beyond maxconn waited", stats["waits"] > 0 and stats["timeouts"] == 0)
+
+# 3. After a server restart every stale idle connection is discarded, not handed out
+print("3. Simulating a server restart with 4 idle connections...")
+
+
+class DeadCursor:
+    def __enter__(self):
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def __exit__(self, *exc):
+        return False
+
+
+for conn in pool._idle:
+    conn.cursor = DeadCursor
+connects.clear()
+pool.health_check_interval = 0
+conn = pool.getconn()
+stats = pool.stats()
+print(f"   - stats: {stats}")
+check("a fresh connection was handed out", conn in connects)
+check("all 4 stale connections were discarded", stats["discarded"] == 4 and stats["open"] == 1)
+pool.putconn(conn)
+PY
+
+echo "--- Test Complete: All checks passed! ---"
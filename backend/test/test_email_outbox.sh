@@ -0,0 +1,192 @@
+#!/bin/bash
+
+# Exercises the email outbox worker against a local aiosmtpd stand-in: queued mail is
+# delivered and marked sent, and a failed send is retried with exponential backoff.
+#
+# Needs the backend's Python environment, aiosmtpd and the POSTGRES_* variables. drain_outbox
+# sends every due message in the table, so the test refuses to run if other mail is waiting.
+# Against docker-compose:
+#   docker compose exec backend sh -c "pip install aiosmtpd && bash test/test_email_outbox.sh"
+
+# Exit immediately if a command exits with a non-zero status.
+set -e
+
+cd "$(dirname "$0")/.."
+
+# --- Configuration ---
+SMTP_PORT="${SMTP_PORT:-1025}"
+RETRY_SECONDS=30
+TAG="outbox-test-$(date +%s)"
+SMTP_LOG="$(mktemp)"
+SMTP_PID=""
+
+export MAIL_SERVER=localhost
+export MAIL_PORT="$SMTP_PORT"
+export MAIL_USE_TLS=false
+export MAIL_USE_SSL=false
+export MAIL_DEFAULT_SENDER=noreply@example.com
+export EMAIL_OUTBOX_RETRY_SECONDS="$RETRY_SECONDS"
+export EMAIL_OUTBOX_MAX_ATTEMPTS=5
+
+# --- Helper Functions ---
+check_deps() {
+  echo "--- Checking for dependencies (python, psycopg2, aiosmtpd) ---"
+  if ! python -c "import psycopg2, flask_mail" &> /dev/null; then
+    echo "The backend requirements could not be imported. Run this from the backend environment."
+    exit 1
+  fi
+  if ! python -c "import aiosmtpd" &> /dev/null; then
+    echo "aiosmtpd could not be found. Please install it (pip install aiosmtpd)."
+    exit 1
+  fi
+  echo "--- Dependencies found ---"
+}
+
+# sql <statement>: runs one statement and prints the rows as a|b|c
+sql() {
+  python - "$1" <<'PY'
+import sys
+import psycopg2
+from app.db import connection_params
+
+conn = psycopg2.connect(**connection_params())
+with conn, conn.cursor() as cur:
+    cur.execute(sys.argv[1])
+    if cur.description:
+        for row in cur.fetchall():
+            print('|'.join('' if value is None else str(value) for value in row))
+conn.close()
+PY
+}
+
+drain() {
+  python - <<'PY'
+from flask import Flask
+from app.email_service import init_email_service, drain_outbox
+
+app = Flask(__name__)
+init_email_service(app)
+drain_outbox(app)
+PY
+}
+
+start_smtp() {
+  python -u -m aiosmtpd -n -l "localhost:$SMTP_PORT" >> "$SMTP_LOG" 2>&1 &
+  SMTP_PID=$!
+  for _ in $(seq 1 50); do
+    if python -c "import socket; socket.create_connection(('localhost', $SMTP_PORT), 1)" &> /dev/null; then
+      return
+    fi
+    sleep 0.1
+  done
+  echo "   - FAILURE: the SMTP stand-in did not start on port $SMTP_PORT."
+  exit 1
+}
+
+stop_smtp() {
+  if [ -n "$SMTP_PID" ]; then
+    kill "$SMTP_PID" 2> /dev/null || true
+    wait "$SMTP_PID" 2> /dev/null || true
+    SMTP_PID=""
+  fi
+}
+
+cleanup() {
+  stop_smtp
+  sql "DELETE FROM email_outbox WHERE recipient LIKE '$TAG-%'" > /dev/null || true
+  rm -f "$SMTP_LOG"
+}
+
+# row <recipient suffix>: prints attempts|sent|last error set|seconds until next attempt
+row() {
+  sql "SELECT attempts, sent_at IS NOT NULL, last_error IS NOT NULL,
+              ROUND(EXTRACT(EPOCH FROM next_attempt_at - NOW()))::int
+       FROM email_outbox WHERE recipient = '$TAG-$1@example.com'"
+}
+
+# --- Main Script ---
+check_deps
+trap cleanup EXIT
+
+echo "--- Starting Email Outbox Test ($TAG) ---"
+
+OTHER_DUE=$(sql "SELECT COUNT(*) FROM email_outbox WHERE sent_at IS NULL AND next_attempt_at <= NOW()")
+if [ "$OTHER_DUE" != "0" ]; then
+  echo "   - $OTHER_DUE other messages are waiting in email_outbox; run this against a test database."
+  exit 1
+fi
+
+# 1. Queued mail is delivered and marked sent
+echo "1. Queueing three messages and draining the outbox..."
+start_smtp
+sql "INSERT INTO email_outbox (recipient, subject, body)
+     SELECT '$TAG-' || n || '@example.com', 'Outbox test ' || n, 'Hello ' || n FROM generate_series(1, 3) n"
+drain
+
+SENT=$(sql "SELECT COUNT(*) FROM email_outbox WHERE recipient LIKE '$TAG-%' AND sent_at IS NOT NULL AND attempts = 1")
+if [ "$SENT" = "3" ] && [ "$(grep -c "$TAG-" "$SMTP_LOG")" -ge 3 ]; then
+  echo "   - SUCCESS: all three messages reached the stand-in and are marked sent."
+else
+  echo "   - FAILURE: expected 3 sent messages, found $SENT."
+  cat "$SMTP_LOG"
+  exit 1
+fi
+
+# 2. A failed send is retried after EMAIL_OUTBOX_RETRY_SECONDS
+echo "2. Stopping the stand-in and draining a new message..."
+stop_smtp
+sql "INSERT INTO email_outbox (recipient, subject, body) VALUES ('$TAG-retry@example.com', 'Outbox retry', 'Hello again')"
+drain
+
+IFS='|' read -r ATTEMPTS SENT_FLAG HAS_ERROR NEXT_IN <<< "$(row retry)"
+echo "   - attempts=$ATTEMPTS sent=$SENT_FLAG error=$HAS_ERROR next attempt in ${NEXT_IN}s"
+if [ "$ATTEMPTS" = "1" ] && [ "$SENT_FLAG" = "False" ] && [ "$HAS_ERROR" = "True" ] \
+  && [ "$NEXT_IN" -ge $((RETRY_SECONDS - 5)) ] && [ "$NEXT_IN" -le "$RETRY_SECONDS" ]; then
+  echo "   - SUCCESS: the failed message is scheduled for a retry."
+else
+  echo "   - FAILURE: the failed message was not scheduled ${RETRY_SECONDS}s ahead."
+  exit 1
+fi
+
+# 3. It is not retried before it is due
+echo "3. Draining again before the retry is due..."
+drain
+IFS='|' read -r ATTEMPTS _ _ _ <<< "$(row retry)"
+if [ "$ATTEMPTS" = "1" ]; then
+  echo "   - SUCCESS: the message was left alone until its next attempt."
+else
+  echo "   - FAILURE: the message was retried early (attempts=$ATTEMPTS)."
+  exit 1
+fi
+
+# 4. The second failure backs off twice as long
+echo "4. Making the retry due while the stand-in is still down..."
+sql "UPDATE email_outbox SET next_attempt_at = NOW() - INTERVAL '1 second' WHERE recipient = '$TAG-retry@example.com'"
+drain
+
+IFS='|' read -r ATTEMPTS SENT_FLAG _ NEXT_IN <<< "$(row retry)"
+echo "   - attempts=$ATTEMPTS sent=$SENT_FLAG next attempt in ${NEXT_IN}s"
+if [ "$ATTEMPTS" = "2" ] && [ "$SENT_FLAG" = "False" ] \
+  && [ "$NEXT_IN" -ge $((RETRY_SECONDS * 2 - 5)) ] && [ "$NEXT_IN" -le $((RETRY_SECONDS * 2)) ]; then
+  echo "   - SUCCESS: the backoff doubled."
+else
+  echo "   - FAILURE: expected the next attempt $((RETRY_SECONDS * 2))s ahead."
+  exit 1
+fi
+
+# 5. Once the server is back the retry is delivered
+echo "5. Restarting the stand-in and making the retry due..."
+start_smtp
+sql "UPDATE email_outbox SET next_attempt_at = NOW() - INTERVAL '1 second' WHERE recipient = '$TAG-retry@example.com'"
+drain
+
+IFS='|' read -r ATTEMPTS SENT_FLAG HAS_ERROR _ <<< "$(row retry)"
+if [ "$ATTEMPTS" = "3" ] && [ "$SENT_FLAG" = "True" ] && [ "$HAS_ERROR" = "False" ] \
+  && grep -q "$TAG-retry@example.com" "$SMTP_LOG"; then
+  echo "   - SUCCESS: the retried message was delivered."
+else
+  echo "   - FAILURE: the retried message was not delivered (attempts=$ATTEMPTS sent=$SENT_FLAG)."
+  exit 1
+fi
+
+echo "--- Test Complete: All checks passed! ---"
@@ -0,0 +1,206 @@
+#!/bin/bash
+
+# Checks that the hot queries are planned as index scans on a database seeded at
+# production-like scale. Everything runs in one transaction that is rolled back, so the
+# seed data never becomes visible and the database is left as it was.
+#
+# Connection settings come from the usual PG* variables (or POSTGRES_* as in docker-compose).
+# The db container does not publish its port, so against docker-compose run:
+#   PSQL="docker compose exec -T db psql -U user -d appdb" bash backend/test/test_query_plans.sh
+
+set -e
+
+export PGHOST="${PGHOST:-${POSTGRES_HOST:-localhost}}"
+export PGUSER="${PGUSER:-${POSTGRES_USER:-user}}"
+export PGPASSWORD="${PGPASSWORD:-${POSTGRES_PASSWORD:-password}}"
+export PGDATABASE="${PGDATABASE:-${POSTGRES_DB:-appdb}}"
+PSQL="${PSQL:-psql}"
+
+# Seed sizes
+DAYS="${PLAN_TEST_DAYS:-30}"
+TRIPS_PER_DAY="${PLAN_TEST_TRIPS_PER_DAY:-2000}"
+STOPS_PER_TRIP="${PLAN_TEST_STOPS_PER_TRIP:-10}"
+USERS="${PLAN_TEST_USERS:-20000}"
+PREDICTIONS_PER_USER="${PLAN_TEST_PREDICTIONS_PER_USER:-10}"
+SENT_EMAILS="${PLAN_TEST_SENT_EMAILS:-50000}"
+
+FAILURES=0
+
+check_deps() {
+  if ! command -v ${PSQL%% *} &> /dev/null; then
+    echo "Error: ${PSQL%% *} is not installed. Please install it to run this test."
+    exit 1
+  fi
+}
+
+# check_plan <query name> <table>... fails the query if its plan scans any listed table sequentially
+check_plan() {
+  local name="$1"
+  shift
+  local plan
+  plan=$(awk -v marker="### $name" '$0 == marker { found = 1; next } /^### / { found = 0 } found' <<< "$PLANS")
+  if [ -z "$plan" ]; then
+    echo "FAIL  $name: no plan captured"
+    FAILURES=$((FAILURES + 1))
+    return
+  fi
+  for table in "$@"; do
+    if grep -qE "Seq Scan on $table( |$)" <<< "$plan"; then
+      echo "FAIL  $name: sequential scan on $table"
+      sed 's/^/        /' <<< "$plan"
+      FAILURES=$((FAILURES + 1))
+      return
+    fi
+  done
+  echo "PASS  $name"
+}
+
+check_deps
+
+echo "--- Seeding $((DAYS * TRIPS_PER_DAY)) trips, $USERS users and $((USERS * PREDICTIONS_PER_USER)) predictions (rolled back afterwards) ---"
+
+PLANS=$($PSQL -X -q -A -t -v ON_ERROR_STOP=1 \
+  -v days="$DAYS" -v trips_per_day="$TRIPS_PER_DAY" -v stops_per_trip="$STOPS_PER_TRIP" \
+  -v users="$USERS" -v predictions_per_user="$PREDICTIONS_PER_USER" -v sent_emails="$SENT_EMAILS" <<'SQL'
+BEGIN;
+
+INSERT INTO routes (route_id, route_short_name, route_long_name) VALUES ('plan_route', 'PLN', 'Query plan route');
+INSERT INTO calendar (service_id, monday, tuesday, wednesday, thursday, friday, saturday, sunday, start_date, end_date)
+VALUES ('plan_service', 1, 1, 1, 1, 1, 1, 1, 20000101, 20991231);
+INSERT INTO stops (stop_id, stop_name, stop_lat, stop_lon)
+SELECT 'plan_stop_' || s, 'Plan stop ' || s, 49.28, -123.12 FROM generate_series(1, :stops_per_trip) s;
+
+-- Day by day, as load_static_data.py inserts them
+INSERT INTO trips (trip_id, service_date, route_id, service_id, trip_headsign, direction_id, shape_id)
+SELECT 'plan_trip_' || t, current_date - d, 'plan_route', 'plan_service', 'Plan', t % 2, 'plan_shape'
+FROM generate_series(0, :days - 1) d, generate_series(1, :trips_per_day) t;
+
+INSERT INTO stop_times (trip_id, service_date, arrival_seconds, departure_seconds, stop_id, stop_sequence)
+SELECT t.trip_id, t.service_date, 18000 + s * 90, 18000 + s * 90, 'plan_stop_' || s, s
+FROM trips t, generate_series(1, :stops_per_trip) s
+WHERE t.route_id = 'plan_route';
+
+INSERT INTO users (nickname, email, password_hash, cumulative_score)
+SELECT 'plan_user_' || u, 'plan_user_' || u || '@example.com', 'x', (u * 7919) % 1000
+FROM generate_series(1, :users) u;
+SELECT min(id) AS first_user, max(id) AS last_user FROM users WHERE nickname LIKE 'plan_user_%' \gset
+
+-- Distinct (trip, day) per user, spread over the whole window
+INSERT INTO predictions (user_id, trip_id, service_date, predicted_outcome, created_at)
+SELECT u, 'plan_trip_' || (1 + (u * 7 + k * 131) % :trips_per_day), current_date - (k % :days),
+       (ARRAY['on_time', 'late', 'early'])[1 + (u + k) % 3], now() - k * interval '1 hour'
+FROM generate_series(:first_user, :last_user) u, generate_series(0, :predictions_per_user - 1) k;
+
+INSERT INTO friend_requests (sender_id, receiver_id, status)
+SELECT u, u + 1, CASE WHEN u % 4 = 0 THEN 'pending' ELSE 'accepted' END
+FROM generate_series(:first_user, :last_user - 1) u;
+
+INSERT INTO friends (user_id1, user_id2)
+SELECT u, u + 1 FROM generate_series(:first_user, :last_user - 1) u
+UNION ALL
+SELECT u + 1, u FROM generate_series(:first_user, :last_user - 1) u;
+
+INSERT INTO email_outbox (recipient, subject, body, sent_at)
+SELECT 'plan@example.com', 'Plan', 'x', now() FROM generate_series(1, :sent_emails);
+INSERT INTO email_outbox (recipient, subject, body)
+SELECT 'plan@example.com', 'Plan', 'x' FROM generate_series(1, 5);
+
+ANALYZE trips;
+ANALYZE stop_times;
+ANALYZE users;
+ANALYZE predictions;
+ANALYZE friend_requests;
+ANALYZE friends;
+ANALYZE email_outbox;
+
+SELECT :first_user + 100 AS uid, :first_user + 101 AS other_uid, 'plan_user_101@example.com' AS user_email \gset
+
+\echo '### score_predictions'
+EXPLAIN SELECT p.user_id, COUNT(*) AS points
+FROM predictions p
+JOIN (VALUES ('plan_trip_42', current_date - 1, 'late'), ('plan_trip_43', current_date - 1, 'late'))
+  AS r (trip_id, service_date, outcome)
+  ON p.trip_id = r.trip_id AND p.service_date = r.service_date AND p.predicted_outcome = r.outcome
+GROUP BY p.user_id;
+
+\echo '### prediction_history'
+EXPLAIN SELECT p.id, p.trip_id, p.service_date, p.predicted_outcome, p.created_at
+FROM predictions p
+WHERE p.user_id = :uid
+ORDER BY p.created_at DESC, p.id DESC
+LIMIT 51;
+
+\echo '### prediction_history_with_trips'
+EXPLAIN SELECT p.id, p.trip_id, p.service_date, p.predicted_outcome, p.created_at, t.outcome
+FROM predictions p
+LEFT JOIN trips t ON p.trip_id = t.trip_id AND p.service_date = t.service_date
+WHERE p.user_id = :uid
+ORDER BY p.created_at DESC, p.id DESC
+LIMIT 51;
+
+\echo '### friend_request_pair'
+EXPLAIN SELECT 1 FROM friend_requests
+WHERE (sender_id = :uid AND receiver_id = :other_uid) OR (sender_id = :other_uid AND receiver_id = :uid);
+
+\echo '### pending_friend_requests'
+EXPLAIN SELECT fr.sender_id, u.nickname, u.email
+FROM friend_requests fr JOIN users u ON fr.sender_id = u.id
+WHERE fr.receiver_id = :uid AND fr.status = 'pending';
+
+\echo '### friends_list'
+EXPLAIN SELECT u.id, u.nickname, u.email, u.cumulative_score
+FROM friends f JOIN users u ON f.user_id2 = u.id
+WHERE f.user_id1 = :uid
+UNION
+SELECT u.id, u.nickname, u.email, u.cumulative_score
+FROM friends f JOIN users u ON f.user_id1 = u.id
+WHERE f.user_id2 = :uid;
+
+\echo '### leaderboard_top'
+EXPLAIN SELECT id, nickname, cumulative_score FROM users ORDER BY cumulative_score DESC, id LIMIT 50;
+
+\echo '### login'
+EXPLAIN SELECT id, password_hash FROM users WHERE email = :'user_email';
+
+\echo '### timetable_trips'
+EXPLAIN SELECT * FROM trips WHERE service_date BETWEEN current_date AND current_date;
+
+\echo '### timetable_stop_times'
+EXPLAIN SELECT * FROM stop_times WHERE service_date BETWEEN current_date AND current_date;
+
+\echo '### timetable_latest_date'
+EXPLAIN SELECT MAX(service_date) FROM trips;
+
+\echo '### email_outbox_due'
+EXPLAIN SELECT id, recipient, subject, body, html, reply_to
+FROM email_outbox
+WHERE sent_at IS NULL AND next_attempt_at <= NOW()
+ORDER BY next_attempt_at
+LIMIT 20
+FOR UPDATE SKIP LOCKED;
+
+ROLLBACK;
+SQL
+)
+
+echo "--- Checking query plans ---"
+
+check_plan score_predictions predictions
+check_plan prediction_history predictions
+check_plan prediction_history_with_trips predictions trips
+check_plan friend_request_pair friend_requests
+check_plan pending_friend_requests friend_requests users
+check_plan friends_list friends users
+check_plan leaderboard_top users
+check_plan login users
+check_plan timetable_trips trips
+check_plan timetable_stop_times stop_times
+check_plan timetable_latest_date trips
+check_plan email_outbox_due email_outbox
+
+if [ "$FAILURES" -ne 0 ]; then
+  echo "--- Test Failed: $FAILURES queries fall back to sequential scans ---"
+  exit 1
+fi
+
+echo "--- Test Complete: All queries use indexes! ---"
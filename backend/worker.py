@@ -0,0 +1,21 @@
+"""
+Runs the trip resolver as its own process, for deployments that set RESOLVER_MODE=external
+on the web workers:
+
+    RESOLVER_MODE=external gunicorn wsgi:app --workers 4
+    python worker.py
+
+Several worker processes may run; the advisory lock in ResolverLeader lets one of them lead.
+"""
+import os
+
+# This process runs the resolver in the foreground instead of a background thread
+os.environ['RESOLVER_MODE'] = 'external'
+
+from app.app import create_app  # noqa: E402
+from app.resolver import ResolverLeader  # noqa: E402
+
+app = create_app()
+
+if __name__ == "__main__":
+    ResolverLeader(app).run()
@@ -51,17 +51,22 @@ CREATE TABLE trips (
     PRIMARY KEY (trip_id, service_date)
 );
 
+-- The timetable loader reads one service-date window at a time
+CREATE INDEX idx_trips_service_date ON trips (service_date);
+
 CREATE TABLE stop_times (
     trip_id VARCHAR(255) NOT NULL,
     service_date DATE NOT NULL,
-    arrival_time VARCHAR(255),
-    departure_time VARCHAR(255),
+    arrival_seconds INTEGER, -- seconds since service-day midnight; may exceed 86400 for after-midnight trips
+    departure_seconds INTEGER,
     stop_id VARCHAR(255) REFERENCES stops(stop_id),
     stop_sequence INT,
     PRIMARY KEY (trip_id, service_date, stop_sequence),
     FOREIGN KEY (trip_id, service_date) REFERENCES trips(trip_id, service_date)
 );
 
+CREATE INDEX idx_stop_times_service_date ON stop_times (service_date);
+
 CREATE TABLE friend_requests (
     id SERIAL PRIMARY KEY,
     sender_id INTEGER REFERENCES users(id),
@@ -70,12 +75,20 @@ CREATE TABLE friend_requests (
     created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- One request per sender/receiver pair; also serves the lookup in either direction
+CREATE UNIQUE INDEX uq_friend_requests_pair ON friend_requests (sender_id, receiver_id);
+-- Pending requests for a receiver
+CREATE INDEX idx_friend_requests_receiver ON friend_requests (receiver_id, status);
+
 CREATE TABLE friends (
     user_id1 INTEGER REFERENCES users(id),
     user_id2 INTEGER REFERENCES users(id),
     PRIMARY KEY (user_id1, user_id2)
 );
 
+-- The primary key covers lookups by user_id1; friend lists also look up by user_id2
+CREATE INDEX idx_friends_user2 ON friends (user_id2, user_id1);
+
 CREATE TABLE predictions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id),
@@ -83,5 +96,61 @@ CREATE TABLE predictions (
     service_date DATE NOT NULL,
     predicted_outcome VARCHAR(255),
     created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (trip_id, service_date) REFERENCES trips(trip_id, service_date)
-);
\ No newline at end of file
+    FOREIGN KEY (trip_id, service_date) REFERENCES trips(trip_id, service_date),
+    CONSTRAINT uq_predictions_user_trip UNIQUE (user_id, trip_id, service_date) -- one prediction per user per trip
+);
+
+-- Leaderboard reads users in score order
+CREATE INDEX idx_users_cumulative_score ON users (cumulative_score DESC, id);
+
+-- Outgoing email, written in the same transaction as the event and sent by a background worker
+CREATE TABLE email_outbox (
+    id SERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT,
+    html TEXT,
+    reply_to VARCHAR(255),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- NULL once retries are exhausted
+    last_error TEXT,
+    sent_at TIMESTAMP WITHOUT TIME ZONE,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_email_outbox_due ON email_outbox (next_attempt_at) WHERE sent_at IS NULL;
+
+-- Prediction history pages are (user_id, created_at, id) range scans; INCLUDE makes /predictions index-only
+CREATE INDEX idx_predictions_user_created ON predictions (user_id, created_at DESC, id DESC)
+    INCLUDE (trip_id, service_date, predicted_outcome);
+
+-- Scoring and history join predictions to trips on (trip_id, service_date)
+CREATE INDEX idx_predictions_trip ON predictions (trip_id, service_date);
+
+-- Per-user prediction stats, maintained during resolution (rebuild with backend/backfill_user_stats.py)
+CREATE TABLE user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    total_resolved INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE user_route_stats (
+    user_id INTEGER REFERENCES users(id),
+    route_id VARCHAR(255) REFERENCES routes(route_id),
+    total_resolved INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, route_id)
+);
+
+-- Resolved predictions waiting for their user's result digest; digest_window is the window number
+-- (epoch seconds / window length). The outbox worker mails one digest per (user_id, digest_window).
+CREATE TABLE prediction_digest_queue (
+    prediction_id INTEGER PRIMARY KEY REFERENCES predictions(id),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    digest_window BIGINT NOT NULL
+);
+
+CREATE INDEX idx_prediction_digest_queue_window ON prediction_digest_queue (digest_window, user_id);
@@ -0,0 +1,16 @@
+-- One prediction per user per trip, which POST /predictions/batch relies on for
+-- ON CONFLICT (user_id, trip_id, service_date). Earlier duplicates are dropped, keeping the
+-- first one made. Safe to run more than once.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_predictions_user_trip') THEN
+        DELETE FROM predictions p
+        USING predictions earlier
+        WHERE earlier.user_id = p.user_id
+          AND earlier.trip_id = p.trip_id
+          AND earlier.service_date = p.service_date
+          AND earlier.id < p.id;
+        ALTER TABLE predictions ADD CONSTRAINT uq_predictions_user_trip UNIQUE (user_id, trip_id, service_date);
+    END IF;
+END $$;
@@ -0,0 +1,27 @@
+-- Store stop_times arrival and departure as integer seconds since service-day midnight.
+-- GTFS times can pass 24:00:00 (a 25:10:00 arrival is 90600), which the TIME type cannot hold.
+-- Safe to run more than once: existing text times are converted once and their columns dropped.
+
+ALTER TABLE stop_times ADD COLUMN IF NOT EXISTS arrival_seconds INTEGER;
+ALTER TABLE stop_times ADD COLUMN IF NOT EXISTS departure_seconds INTEGER;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'stop_times' AND column_name = 'arrival_time'
+    ) THEN
+        UPDATE stop_times
+        SET arrival_seconds = CASE WHEN trim(arrival_time) ~ '^\d+:\d{1,2}:\d{1,2}$' THEN
+                split_part(trim(arrival_time), ':', 1)::int * 3600
+                + split_part(trim(arrival_time), ':', 2)::int * 60
+                + split_part(trim(arrival_time), ':', 3)::int
+            END,
+            departure_seconds = CASE WHEN trim(departure_time) ~ '^\d+:\d{1,2}:\d{1,2}$' THEN
+                split_part(trim(departure_time), ':', 1)::int * 3600
+                + split_part(trim(departure_time), ':', 2)::int * 60
+                + split_part(trim(departure_time), ':', 3)::int
+            END;
+        ALTER TABLE stop_times DROP COLUMN arrival_time, DROP COLUMN departure_time;
+    END IF;
+END $$;
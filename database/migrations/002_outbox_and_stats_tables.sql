@@ -0,0 +1,36 @@
+-- Tables added to init.sql after the first release: the email outbox and per-user prediction stats.
+-- Databases created from an older init.sql get them here; newer ones already have them.
+-- After this creates user_stats on a database with resolved predictions, run backend/backfill_user_stats.py.
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id SERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT,
+    html TEXT,
+    reply_to VARCHAR(255),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- NULL once retries are exhausted
+    last_error TEXT,
+    sent_at TIMESTAMP WITHOUT TIME ZONE,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (next_attempt_at) WHERE sent_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    total_resolved INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_route_stats (
+    user_id INTEGER REFERENCES users(id),
+    route_id VARCHAR(255) REFERENCES routes(route_id),
+    total_resolved INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, route_id)
+);
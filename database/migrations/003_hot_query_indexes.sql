@@ -0,0 +1,42 @@
+-- Indexes and unique constraints for the queries the app runs on every request or resolver run.
+-- Plain CREATE INDEX (not CONCURRENTLY) so each migration stays one transaction; it blocks
+-- writes to the table while it builds.
+
+-- Leaderboard reads users in score order
+CREATE INDEX IF NOT EXISTS idx_users_cumulative_score ON users (cumulative_score DESC, id);
+
+-- Prediction history pages are (user_id, created_at, id) range scans; INCLUDE makes /predictions index-only
+CREATE INDEX IF NOT EXISTS idx_predictions_user_created ON predictions (user_id, created_at DESC, id DESC)
+    INCLUDE (trip_id, service_date, predicted_outcome);
+
+-- Scoring and history join predictions to trips on (trip_id, service_date)
+CREATE INDEX IF NOT EXISTS idx_predictions_trip ON predictions (trip_id, service_date);
+
+-- The one-prediction-per-user-per-trip constraint is added by 000_predictions_one_per_user_trip.sql
+
+-- One request per sender/receiver pair. It also serves the lookup in either direction
+-- (a BitmapOr of two index probes) and accept/decline by pair.
+DELETE FROM friend_requests r
+USING friend_requests earlier
+WHERE earlier.sender_id = r.sender_id
+  AND earlier.receiver_id = r.receiver_id
+  AND earlier.id < r.id
+  AND NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uq_friend_requests_pair');
+CREATE UNIQUE INDEX IF NOT EXISTS uq_friend_requests_pair ON friend_requests (sender_id, receiver_id);
+
+-- Pending requests for a receiver
+CREATE INDEX IF NOT EXISTS idx_friend_requests_receiver ON friend_requests (receiver_id, status);
+
+-- The primary key covers lookups by user_id1; friend lists also look up by user_id2
+CREATE INDEX IF NOT EXISTS idx_friends_user2 ON friends (user_id2, user_id1);
+
+-- The timetable loader and its content version read one service-date window at a time
+CREATE INDEX IF NOT EXISTS idx_trips_service_date ON trips (service_date);
+CREATE INDEX IF NOT EXISTS idx_stop_times_service_date ON stop_times (service_date);
+
+ANALYZE users;
+ANALYZE predictions;
+ANALYZE friend_requests;
+ANALYZE friends;
+ANALYZE trips;
+ANALYZE stop_times;
@@ -0,0 +1,10 @@
+-- Result digests are batched per time window: resolved predictions wait here until their
+-- window closes, and the outbox worker mails each user one digest per (user_id, digest_window).
+
+CREATE TABLE IF NOT EXISTS prediction_digest_queue (
+    prediction_id INTEGER PRIMARY KEY REFERENCES predictions(id),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    digest_window BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_prediction_digest_queue_window ON prediction_digest_queue (digest_window, user_id);
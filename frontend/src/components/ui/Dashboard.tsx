@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../../contexts/AuthContext';
-import { makeAuthenticatedRequest } from '../../utils/auth';
+import { makeAuthenticatedRequest, fetchPage } from '../../utils/auth';
 import { API_ENDPOINTS } from '../../config/api';
 import './Dashboard.css';
 
@@ -52,12 +52,30 @@ interface PredictionHistory {
   prediction_result: 'correct' | 'incorrect' | null;
 }
 
+interface PredictionStats {
+  total_resolved: number;
+  correct: number;
+  accuracy: number | null;
+}
+
+// Predictions for trips from today on: one page covers every trip the dashboard lists
+const UPCOMING_PREDICTIONS_PAGE_SIZE = 500;
+
+const localDateString = (date: Date) =>
+  `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`;
+
+const upcomingPredictionsUrl = () =>
+  `${API_ENDPOINTS.PREDICTIONS}?from=${localDateString(new Date())}`;
+
 const Dashboard: React.FC = () => {
   const { token, logout } = useAuth();
   const [userData, setUserData] = useState<UserData | null>(null);
   const [trips, setTrips] = useState<Trip[]>([]);
   const [predictions, setPredictions] = useState<Prediction[]>([]);
   const [predictionHistory, setPredictionHistory] = useState<PredictionHistory[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [loadingMoreHistory, setLoadingMoreHistory] = useState(false);
+  const [predictionStats, setPredictionStats] = useState<PredictionStats | null>(null);
   const [friends, setFriends] = useState<Friend[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -79,11 +97,13 @@ const Dashboard: React.FC = () => {
   const loadDashboardData = async () => {
     try {
       setLoading(true);
-      const [userResponse, tripsResponse, predictionsResponse, predictionHistoryResponse, friendsResponse] = await Promise.all([
+      // Totals and accuracy come from /predictions/stats; history loads one page at a time
+      const [userResponse, tripsResponse, predictionsPage, historyPage, statsResponse, friendsResponse] = await Promise.all([
         makeAuthenticatedRequest('http://localhost:8000/auth/profile'),
         fetch('http://localhost:8000/trips'),
-        makeAuthenticatedRequest('http://localhost:8000/predictions'),
-        makeAuthenticatedRequest('http://localhost:8000/predictions/history'),
+        fetchPage<Prediction>(upcomingPredictionsUrl(), null, UPCOMING_PREDICTIONS_PAGE_SIZE),
+        fetchPage<PredictionHistory>(API_ENDPOINTS.PREDICTIONS_HISTORY),
+        makeAuthenticatedRequest(API_ENDPOINTS.PREDICTIONS_STATS),
         makeAuthenticatedRequest('http://localhost:8000/auth/friends')
       ]);
 
@@ -112,14 +132,17 @@ const Dashboard: React.FC = () => {
         setError('Failed to load available trips');
       }
 
-      if (predictionsResponse.ok) {
-        const predictionsData = await predictionsResponse.json();
-        setPredictions(predictionsData);
+      if (predictionsPage) {
+        setPredictions(predictionsPage.items);
+      }
+
+      if (historyPage) {
+        setPredictionHistory(historyPage.items);
+        setHistoryCursor(historyPage.nextCursor);
       }
 
-      if (predictionHistoryResponse.ok) {
-        const historyData = await predictionHistoryResponse.json();
-        setPredictionHistory(historyData);
+      if (statsResponse.ok) {
+        setPredictionStats(await statsResponse.json());
       }
 
       if (friendsResponse.ok) {
@@ -152,10 +175,9 @@ const Dashboard: React.FC = () => {
       if (response.ok) {
         // Just reload predictions instead of all dashboard data
         try {
-          const predictionsResponse = await makeAuthenticatedRequest(API_ENDPOINTS.PREDICTIONS);
-          if (predictionsResponse.ok) {
-            const predictionsData = await predictionsResponse.json();
-            setPredictions(predictionsData);
+          const predictionsPage = await fetchPage<Prediction>(upcomingPredictionsUrl(), null, UPCOMING_PREDICTIONS_PAGE_SIZE);
+          if (predictionsPage) {
+            setPredictions(predictionsPage.items);
           }
         } catch (err) {
           const message = err instanceof Error
@@ -194,6 +216,27 @@ const Dashboard: React.FC = () => {
     }
   };
 
+  const loadMoreHistory = async () => {
+    if (!historyCursor) return;
+
+    try {
+      setLoadingMoreHistory(true);
+      const historyPage = await fetchPage<PredictionHistory>(API_ENDPOINTS.PREDICTIONS_HISTORY, historyCursor);
+      if (historyPage) {
+        setPredictionHistory(prev => [...prev, ...historyPage.items]);
+        setHistoryCursor(historyPage.nextCursor);
+      } else {
+        setError('Failed to load more predictions');
+        setTimeout(() => setError(''), 5000);
+      }
+    } catch (err) {
+      setError('Network error. Please try again.');
+      setTimeout(() => setError(''), 5000);
+    } finally {
+      setLoadingMoreHistory(false);
+    }
+  };
+
   const handleTripClick = (trip: Trip) => {
     setSelectedTrip(trip);
     setPredictionOutcome('');
@@ -236,8 +279,7 @@ const Dashboard: React.FC = () => {
     return predictionDate.toDateString() === today.toDateString();
   });
 
-  const accuracy = predictions.length > 0 ? 
-    Math.round((predictions.filter(p => p.predicted_outcome === 'on_time').length / predictions.length) * 100) : 0;
+  const accuracy = predictionStats?.accuracy != null ? Math.round(predictionStats.accuracy * 100) : 0;
 
   return (
     <div className="dashboard-container">
@@ -532,6 +574,17 @@ const Dashboard: React.FC = () => {
               ))}
             </div>
           )}
+          {historyCursor && (
+            <div className="trips-pagination">
+              <button
+                className="page-btn"
+                onClick={loadMoreHistory}
+                disabled={loadingMoreHistory}
+              >
+                {loadingMoreHistory ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -14,6 +14,8 @@ export const API_ENDPOINTS = {
   },
   TRIPS: `${API_BASE_URL}/trips`,
   PREDICTIONS: `${API_BASE_URL}/predictions`,
+  PREDICTIONS_HISTORY: `${API_BASE_URL}/predictions/history`,
+  PREDICTIONS_STATS: `${API_BASE_URL}/predictions/stats`,
   LEADERBOARD: `${API_BASE_URL}/leaderboard`,
 } as const;
 
@@ -29,6 +29,26 @@ export const makeAuthenticatedRequest = async (url: string, options: RequestInit
   return response;
 };
 
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+// Fetches one page of a cursor-paginated list endpoint (e.g. /predictions). Pass the previous
+// page's nextCursor (from X-Next-Cursor) to get the page after it. Returns null if the request fails.
+export const fetchPage = async <T>(
+  url: string,
+  cursor: string | null = null,
+  pageSize?: number
+): Promise<Page<T> | null> => {
+  const pageUrl = new URL(url, window.location.origin);
+  if (pageSize) pageUrl.searchParams.set('limit', String(pageSize));
+  if (cursor) pageUrl.searchParams.set('after', cursor);
+
+  const response = await makeAuthenticatedRequest(pageUrl.toString());
+  if (!response.ok) return null;
+  return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+};
 
 // Helper function to check if user is authenticated
 export const isAuthenticated = (): boolean => {